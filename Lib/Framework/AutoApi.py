@@ -2,37 +2,90 @@ from multiprocessing.pool import ThreadPool as Pool
 import datetime
 import time
 from email import encoders
-from email.utils import COMMASPACE, formatdate
+from email.utils import COMMASPACE, formatdate, make_msgid
+from email.header import Header
 from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
 from email.mime.multipart import MIMEMultipart
 from pathlib import Path
 import smtplib
+import threading
+import glob
+import hashlib
+import pickle
+import base64
+import gzip
+import re
+import shutil
+import tempfile
+import uuid
+import zipfile
+import heapq
+import logging
+import random
+import signal
+import asyncio
+import inspect
+from multiprocessing import resource_tracker, shared_memory
+import concurrent.futures
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 
-from dbfread import DBF
-import pyodbc
-import pandas as pd
+import importlib
+import decimal
+import sqlite3
 import os
 import json
+import sys
 
-from cryptography.fernet import Fernet
 from typing import Callable, Any, List, Dict
 
+from .schedule_rules import BusinessCalendar, CalendarRule, rule_for
+from .telemetry import telemetry
+from .run_journal import journal, slot_key
+
+
+class _LazyModule:
+    # Stands in for a module and imports it on first use, so importing AutoApi does not
+    # pay for pandas, pyodbc and friends until something actually needs them
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attribute)
+
+
+pd = _LazyModule("pandas")
+np = _LazyModule("numpy")
+pyodbc = _LazyModule("pyodbc")
+dbfread = _LazyModule("dbfread")
+fernet = _LazyModule("cryptography.fernet")
+
 
 class ConfigProperties:
-    def __init__(self, config_structure=None, file_type=None, enviroment_key=None):
+    def __init__(self, config_structure=None, file_type=None, enviroment_key=None, cache_ttl=None):
         self.config_structure = config_structure
         self.file_type = file_type
         self.enviroment_key = enviroment_key
+        # Seconds decrypted values are kept in memory by decrypt_config; None keeps them until the file changes
+        self.cache_ttl = cache_ttl
 
-    def encrypt_config(self, data, key_path, encrypted_data_path):
-        # Generate a Fernet key
-        key = Fernet.generate_key()
-        # Write the key to the specified file path
-        with open(f"{key_path}.txt", 'wb') as f:
-            f.write(key)
-        # Initialize the encryption object with the key
-        cipher = Fernet(key)
+    def encrypt_config(self, data, key_path, encrypted_data_path, reuse_key=False):
+        # reuse_key keeps the existing key file, so stores and daemons already reading it stay valid
+        if reuse_key and os.path.exists(f"{key_path}.txt"):
+            with open(f"{key_path}.txt", 'rb') as f:
+                keys = f.read().split()
+        else:
+            # Generate a Fernet key
+            keys = [fernet.Fernet.generate_key()]
+            # Write the key to the specified file path
+            with open(f"{key_path}.txt", 'wb') as f:
+                f.write(keys[0])
+        # Initialize the encryption object with the key; the first key encrypts
+        cipher = fernet.MultiFernet([fernet.Fernet(key) for key in keys])
         # Encrypt each value in the dictionary
         encrypted_data = {}
         if self.file_type == 'json':
@@ -41,11 +94,8 @@ class ConfigProperties:
                     encrypted_data[key] = cipher.encrypt(
                         value.encode()).decode()
             elif self.config_structure == 'nested':
-                for key, value in data.items():
-                    encrypted_data[key] = {}
-                    for sub_key, sub_value in value.items():
-                        encrypted_data[key][sub_key] = cipher.encrypt(
-                            sub_value.encode()).decode()
+                # Environments can be nested to any depth, e.g. {env: {service: {setting: value}}}
+                encrypted_data = ConfigStore._map(data, lambda value: cipher.encrypt(value.encode()).decode())
             # Write the encrypted dictionary to the specified JSON file path
             with open(f"{encrypted_data_path}.json", 'w') as f:
                 json.dump(encrypted_data, f)
@@ -54,47 +104,833 @@ class ConfigProperties:
                 "Invalid config file format. In the future, YAML, TOML, and INI files will be supported")
 
     def decrypt_config(self, key_path, data_path):
-        # Read the encryption key from the file
-        with open(key_path, 'rb') as f:
-            key = f.read()
-        # Initialize the decryption object with the key
-        cipher = Fernet(key)
-        # Read the encrypted data from the file
-        if self.file_type == 'json':
-            with open(data_path, 'r') as f:
-                encrypted_data = json.load(f)
-            # Decrypt each value in the dictionary
-            decrypted_data = {}
-            if isinstance(encrypted_data.get(self.enviroment_key), dict) and self.enviroment_key != None:
-                for key, value in encrypted_data.get(self.enviroment_key).items():
-                    decrypted_data[key] = cipher.decrypt(
-                        value.encode()).decode()
-            else:
-                for key, value in encrypted_data.items():
-                    decrypted_data[key] = cipher.decrypt(
-                        value.encode()).decode()
-        else:
+        if self.file_type != 'json':
             raise ValueError(
                 "Invalid config file format. In the future, YAML, TOML, and INI files will be supported")
-        # Return the decrypted data
-        return decrypted_data
+        # The store is shared per file, so only values that were never read before get decrypted
+        store = ConfigStore.shared(data_path, key_path, ttl=self.cache_ttl)
+        if self.enviroment_key is not None and store.is_section(self.enviroment_key):
+            return store.section(self.enviroment_key)
+        return store.section()
+
+class ConfigStore:
+    # Loads an encrypt_config file once and decrypts values on first access. The key file
+    # may hold several keys, newest first; any of them can decrypt, the first encrypts.
+    _shared = {}
+    _shared_lock = threading.Lock()
+    _missing = object()
+
+    def __init__(self, data_path, key_path, ttl=None):
+        self.data_path = data_path
+        self.key_path = key_path
+        # Seconds a decrypted value is kept in memory; None keeps it until the files change
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._signature = None
+        self._keys = []
+        self._cipher = None
+        self._encrypted = {}
+        self._plain = {}
+        self._counters = {"hits": 0, "decrypts": 0, "reloads": 0}
+
+    @classmethod
+    def shared(cls, data_path, key_path, ttl=None):
+        key = (os.path.abspath(data_path), os.path.abspath(key_path), ttl)
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(data_path, key_path, ttl)
+            return cls._shared[key]
+
+    @classmethod
+    def clear_shared(cls):
+        # Forget every shared store, so the next decrypt_config reads and decrypts from scratch
+        with cls._shared_lock:
+            cls._shared.clear()
+
+    def get(self, path, default=_missing):
+        # path is a tuple of keys or a dotted string, e.g. "prod.database.password"
+        with self._lock:
+            self._reload_if_changed()
+            return self._value(self._split(path), default)
+
+    def __getitem__(self, path):
+        return self.get(path)
+
+    def __contains__(self, path):
+        with self._lock:
+            self._reload_if_changed()
+            return self._node(self._split(path)) is not self._missing
+
+    def is_section(self, path):
+        with self._lock:
+            self._reload_if_changed()
+            return isinstance(self._node(self._split(path)), dict)
+
+    def section(self, path=()):
+        # Plaintext copy of everything under path, nested the same way as the file
+        keys = self._split(path)
+        with self._lock:
+            self._reload_if_changed()
+            if not isinstance(self._node(keys), dict):
+                raise KeyError(f"{'.'.join(keys) or 'The config'} is not a section")
+            return self._section(keys)
+
+    def rotate(self, keep_old_keys=True):
+        # Re-encrypt every value under a new key. Processes already holding a store reload the
+        # key file and data on their next access; the key file is written first and keeps the
+        # old key until the data is rewritten, so readers never see data they cannot decrypt
+        with self._lock:
+            self._reload_if_changed()
+            keys = [fernet.Fernet.generate_key()] + self._keys
+            cipher = fernet.MultiFernet([fernet.Fernet(key) for key in keys])
+            rotated = self._map(self._encrypted, lambda token: cipher.rotate(token.encode()).decode())
+            self._write_atomic(self.key_path, b"\n".join(keys))
+            self._write_atomic(self.data_path, json.dumps(rotated).encode())
+            if not keep_old_keys:
+                self._write_atomic(self.key_path, keys[0])
+            self._reload_if_changed()
+
+    def clear(self):
+        # Drop every decrypted value held in memory
+        with self._lock:
+            self._plain.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["cached_values"] = len(self._plain)
+        return stats
+
+    def _reload_if_changed(self):
+        signature = tuple((stat.st_mtime_ns, stat.st_size) for stat in (os.stat(self.key_path), os.stat(self.data_path)))
+        if signature == self._signature:
+            return
+        with open(self.key_path, 'rb') as f:
+            self._keys = f.read().split()
+        with open(self.data_path, 'r') as f:
+            self._encrypted = json.load(f)
+        self._cipher = fernet.MultiFernet([fernet.Fernet(key) for key in self._keys])
+        self._plain.clear()
+        self._signature = signature
+        self._counters["reloads"] += 1
+
+    def _value(self, keys, default=_missing):
+        cached = self._plain.get(keys)
+        if cached is not None and (self.ttl is None or time.monotonic() - cached[1] < self.ttl):
+            self._counters["hits"] += 1
+            return cached[0]
+        node = self._node(keys)
+        if node is self._missing:
+            if default is self._missing:
+                raise KeyError(".".join(keys))
+            return default
+        if isinstance(node, dict):
+            return self._section(keys)
+        value = self._cipher.decrypt(node.encode()).decode()
+        self._counters["decrypts"] += 1
+        self._plain[keys] = (value, time.monotonic())
+        return value
+
+    def _section(self, keys):
+        return {key: self._section(keys + (key,)) if isinstance(value, dict) else self._value(keys + (key,))
+                for key, value in self._node(keys).items()}
+
+    def _node(self, keys):
+        node = self._encrypted
+        for key in keys:
+            if not isinstance(node, dict) or key not in node:
+                return self._missing
+            node = node[key]
+        return node
+
+    @staticmethod
+    def _split(path):
+        if isinstance(path, str):
+            return tuple(path.split('.')) if path else ()
+        return tuple(path)
+
+    @staticmethod
+    def _map(tree, func):
+        return {key: ConfigStore._map(value, func) if isinstance(value, dict) else func(value)
+                for key, value in tree.items()}
+
+    @staticmethod
+    def _write_atomic(path, data):
+        partial = f"{path}.{os.getpid()}.tmp"
+        with open(partial, 'wb') as f:
+            f.write(data)
+        os.replace(partial, path)
+
+class ConnectionPool:
+    def __init__(self, connection_string, max_size=5, idle_timeout=300, health_check=True,
+                 health_check_query="SELECT 1", acquire_timeout=30, connect=None):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.connection_string = connection_string
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check = health_check
+        self.health_check_query = health_check_query
+        self.acquire_timeout = acquire_timeout
+        self._connect = connect or pyodbc.connect
+        # Idle connections are kept as (connection, released_at) pairs, most recently used last
+        self._idle = deque()
+        self._size = 0
+        self._condition = threading.Condition()
+        self._counters = {"hits": 0, "misses": 0, "waits": 0, "wait_seconds": 0.0,
+                          "timeouts": 0, "expired": 0, "health_check_failures": 0}
+
+    def acquire(self, timeout=None):
+        timeout = self.acquire_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            connection = None
+            create = False
+            with self._condition:
+                waited_since = None
+                while not self._idle and self._size >= self.max_size:
+                    # Every connection is in use, wait for one to be released
+                    if waited_since is None:
+                        waited_since = time.monotonic()
+                        self._counters["waits"] += 1
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._counters["timeouts"] += 1
+                        self._counters["wait_seconds"] += time.monotonic() - waited_since
+                        raise TimeoutError(f"No database connection became available within {timeout}s")
+                    self._condition.wait(remaining)
+                if waited_since is not None:
+                    self._counters["wait_seconds"] += time.monotonic() - waited_since
+                if self._idle:
+                    connection, released_at = self._idle.pop()
+                    if self.idle_timeout is not None and time.monotonic() - released_at > self.idle_timeout:
+                        self._counters["expired"] += 1
+                        self._size -= 1
+                        self._close_quietly(connection)
+                        continue
+                else:
+                    self._size += 1
+                    create = True
+            # Connecting and health checks happen outside the lock so other threads are not blocked
+            if create:
+                try:
+                    connection = self._connect(self.connection_string)
+                except Exception:
+                    self._forget()
+                    raise
+                self._count("misses")
+                return connection
+            if self._is_healthy(connection):
+                self._count("hits")
+                return connection
+            self._count("health_check_failures")
+            self._forget()
+            self._close_quietly(connection)
+
+    def release(self, connection, discard=False):
+        if connection is None:
+            return
+        if not discard:
+            try:
+                # Never hand an open transaction to the next borrower
+                connection.rollback()
+            except Exception:
+                discard = True
+        if discard:
+            self._forget()
+            self._close_quietly(connection)
+            return
+        with self._condition:
+            self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        connection = self.acquire(timeout)
+        try:
+            yield connection
+        except BaseException:
+            self.release(connection, discard=self._is_broken(connection))
+            raise
+        else:
+            self.release(connection)
+
+    def close_all(self):
+        with self._condition:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+        for connection, _ in idle:
+            self._close_quietly(connection)
+
+    def stats(self):
+        with self._condition:
+            stats = dict(self._counters)
+            stats.update({"size": self._size, "idle": len(self._idle),
+                          "in_use": self._size - len(self._idle), "max_size": self.max_size})
+        borrows = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / borrows, 4) if borrows else 0.0
+        stats["wait_seconds"] = round(stats["wait_seconds"], 6)
+        return stats
+
+    def _is_healthy(self, connection):
+        if not self.health_check:
+            return True
+        return not self._is_broken(connection)
+
+    def _is_broken(self, connection):
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute(self.health_check_query)
+                cursor.fetchone()
+            finally:
+                cursor.close()
+            return False
+        except Exception:
+            return True
+
+    def _count(self, counter):
+        with self._condition:
+            self._counters[counter] += 1
+
+    def _forget(self):
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+    @staticmethod
+    def _close_quietly(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+class TableSchema:
+    # SQL Server types, and the Python type names the driver reports for temp tables,
+    # whose values are converted before binding when the DataFrame holds something else
+    INTEGER_TYPES = {'tinyint', 'smallint', 'int', 'bigint'}
+    BIT_TYPES = {'bit', 'bool'}
+    DATE_TYPES = {'date'}
+
+    def __init__(self, table_name, columns, types, nullable, key_columns):
+        self.table_name = table_name
+        self.columns = columns
+        self.types = types
+        self.nullable = nullable
+        self.key_columns = key_columns
+        self.loaded_at = time.monotonic()
+        # Converters worked out per (columns, dtypes) layout, so each load decides them once
+        self._converters = {}
+
+    def __repr__(self):
+        return f"TableSchema({self.table_name!r}, columns={self.columns!r}, key_columns={self.key_columns!r})"
+
+    def prepare_rows(self, columns, frame):
+        # Turn a DataFrame batch (its columns in the order of columns) into rows of plain
+        # Python values with None for NaN/NaT/NA, converting each column by its SQL type
+        converters = self.converters(columns, frame)
+        values = []
+        for position, (column, convert) in enumerate(zip(columns, converters)):
+            converted = convert(frame.iloc[:, position])
+            if not self.nullable.get(column, True) and None in converted:
+                raise ValueError(f"Column {column} of {self.table_name} does not allow NULL but the data has missing values")
+            values.append(converted)
+        return [list(row) for row in zip(*values)]
+
+    def converters(self, columns, frame):
+        layout = (tuple(columns), tuple(str(dtype) for dtype in frame.dtypes))
+        converters = self._converters.get(layout)
+        if converters is None:
+            converters = [self._converter(str(self.types.get(column, '')).lower(), frame.dtypes.iloc[position])
+                          for position, column in enumerate(columns)]
+            self._converters[layout] = converters
+        return converters
+
+    @classmethod
+    def _converter(cls, sql_type, dtype):
+        # Only numbers are converted for integer and bit columns; strings such as "0" or "N"
+        # are passed through for SQL Server to convert
+        if sql_type in cls.INTEGER_TYPES and dtype.kind in 'fb':
+            return cls._to_int
+        if sql_type in cls.BIT_TYPES and dtype.kind in 'iuf':
+            return cls._to_bool
+        if sql_type in cls.DATE_TYPES and dtype.kind == 'M':
+            return cls._to_date
+        if isinstance(dtype, np.dtype) and dtype.kind == 'M':
+            return cls._to_datetime
+        return cls._plain
+
+    @staticmethod
+    def _plain(series):
+        values = series.tolist()
+        if not series.hasnans:
+            return values
+        return [None if missing else value for value, missing in zip(values, series.isna().tolist())]
+
+    @classmethod
+    def _to_int(cls, series):
+        # e.g. an integer column that picked up NaN and became float
+        return [None if value is None else int(value) for value in cls._plain(series)]
+
+    @classmethod
+    def _to_bool(cls, series):
+        return [None if value is None else bool(value) for value in cls._plain(series)]
+
+    @staticmethod
+    def _to_datetime(series):
+        # numpy turns datetime64 straight into datetimes (NaT into None), far faster than
+        # building a Timestamp per value; the driver binds microseconds anyway
+        return series.to_numpy().astype('datetime64[us]').astype(object).tolist()
+
+    @classmethod
+    def _to_date(cls, series):
+        return [None if value is None else value.date() for value in cls._plain(series)]
+
+class SchemaCache:
+    def __init__(self, ttl=600, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, cursor, table_name, scope=None):
+        key = (scope, table_name.lower())
+        with self._lock:
+            schema = self._entries.get(key)
+            if schema is not None and (self.ttl is None or time.monotonic() - schema.loaded_at <= self.ttl):
+                self._entries.move_to_end(key)
+                self._counters["hits"] += 1
+                return schema
+            self._counters["misses"] += 1
+        schema = self._load(cursor, table_name)
+        # Temp tables only live as long as their connection, so they are never cached
+        if not table_name.split('.')[-1].strip('[]').startswith('#'):
+            with self._lock:
+                self._entries[key] = schema
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self._counters["evictions"] += 1
+        return schema
+
+    def invalidate(self, table_name=None, scope=None):
+        with self._lock:
+            if table_name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop((scope, table_name.lower()), None)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = len(self._entries)
+        return stats
+
+    def _load(self, cursor, table_name):
+        parts = [part.strip('[]"') for part in table_name.split('.')]
+        name = parts[-1]
+        if not name.startswith('#'):
+            schema_name = parts[-2] if len(parts) > 1 and parts[-2] else None
+            catalog = f"[{parts[-3]}]." if len(parts) > 2 else ""
+            cursor.execute(f"""
+        select COLUMN_NAME, DATA_TYPE, IS_NULLABLE
+        from {catalog}INFORMATION_SCHEMA.COLUMNS
+        where TABLE_SCHEMA = coalesce(?, schema_name()) and TABLE_NAME = ?
+        order by ORDINAL_POSITION;""", schema_name, name)
+            rows = cursor.fetchall()
+            if rows:
+                cursor.execute(f"""
+        select k.COLUMN_NAME
+        from {catalog}INFORMATION_SCHEMA.TABLE_CONSTRAINTS t
+            join {catalog}INFORMATION_SCHEMA.KEY_COLUMN_USAGE k
+                on k.CONSTRAINT_NAME = t.CONSTRAINT_NAME
+                and k.TABLE_SCHEMA = t.TABLE_SCHEMA
+                and k.TABLE_NAME = t.TABLE_NAME
+        where t.CONSTRAINT_TYPE = 'PRIMARY KEY'
+            and t.TABLE_SCHEMA = coalesce(?, schema_name()) and t.TABLE_NAME = ?
+        order by k.ORDINAL_POSITION;""", schema_name, name)
+                key_columns = [row[0] for row in cursor.fetchall()]
+                return TableSchema(table_name,
+                                   [row[0] for row in rows],
+                                   {row[0]: row[1] for row in rows},
+                                   {row[0]: row[2] == 'YES' for row in rows},
+                                   key_columns)
+        # Temp tables, synonyms and anything else INFORMATION_SCHEMA cannot see fall back to
+        # the driver's description of an empty result
+        cursor.execute(f"SELECT TOP 0 * FROM {table_name}")
+        return TableSchema(table_name,
+                           [column[0] for column in cursor.description],
+                           {column[0]: getattr(column[1], '__name__', str(column[1])) for column in cursor.description},
+                           {column[0]: bool(column[6]) for column in cursor.description},
+                           [])
+
+# Shared by every SqlOperations instance in the process unless one is passed in
+default_schema_cache = SchemaCache()
+
+class WatermarkStore:
+    # High-water marks for incremental extracts, one per source, in a local SQLite file
+    def __init__(self, path="watermarks.db"):
+        self.path = path
+        with self._connect() as connection:
+            connection.execute("""
+                create table if not exists watermarks (
+                    source text primary key,
+                    watermark_column text not null,
+                    value_type text not null,
+                    value text not null,
+                    rows integer not null,
+                    updated_at text not null)""")
+
+    def get(self, source, default=None):
+        with self._connect() as connection:
+            row = connection.execute("select value_type, value from watermarks where source = ?", (source,)).fetchone()
+        return self._decode(*row) if row else default
+
+    def set(self, source, watermark_column, value, rows=0):
+        value_type, text = self._encode(value)
+        with self._connect() as connection:
+            connection.execute("insert or replace into watermarks values (?, ?, ?, ?, ?, ?)",
+                               (source, watermark_column, value_type, text, rows,
+                                datetime.datetime.now().isoformat(timespec="seconds")))
+
+    def reset(self, source):
+        # The next extract for source starts from the beginning again
+        with self._connect() as connection:
+            connection.execute("delete from watermarks where source = ?", (source,))
+
+    def all(self):
+        with self._connect() as connection:
+            rows = connection.execute(
+                "select source, watermark_column, value_type, value, rows, updated_at from watermarks order by source").fetchall()
+        return [{"source": row[0], "watermark_column": row[1], "value": self._decode(row[2], row[3]),
+                 "rows": row[4], "updated_at": row[5]} for row in rows]
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _encode(value):
+        # rowversion columns come back as bytes, modified dates as datetimes, identities as ints
+        if isinstance(value, (bytes, bytearray)):
+            return "bytes", bytes(value).hex()
+        if isinstance(value, datetime.datetime):
+            return "datetime", value.isoformat()
+        if isinstance(value, datetime.date):
+            return "date", value.isoformat()
+        if isinstance(value, bool) or not isinstance(value, (int, float, decimal.Decimal, str)):
+            raise TypeError(f"Cannot use {type(value).__name__} values as a watermark")
+        return type(value).__name__.lower(), str(value)
+
+    @staticmethod
+    def _decode(value_type, text):
+        decoders = {"bytes": bytes.fromhex, "datetime": datetime.datetime.fromisoformat,
+                    "date": datetime.date.fromisoformat, "int": int, "float": float,
+                    "decimal": decimal.Decimal, "str": str}
+        return decoders[value_type](text)
+
+class IncrementalBatch:
+    def __init__(self, source, watermark_column, data, previous_watermark):
+        self.source = source
+        self.watermark_column = watermark_column
+        self.data = data
+        self.previous_watermark = previous_watermark
+        self.rows = len(data)
+        if watermark_column not in data.columns:
+            raise ValueError(f"{source}: watermark column {watermark_column} is not in the extracted columns")
+        # The watermark to save once the rows are written; never moves backwards
+        self.watermark = previous_watermark
+        latest = self._latest(data[watermark_column]) if self.rows else None
+        if latest is not None and (previous_watermark is None or latest > previous_watermark):
+            self.watermark = latest
+
+    @staticmethod
+    def _latest(column):
+        values = column.dropna()
+        if values.empty:
+            return None
+        value = values.max()
+        # Back to plain Python values so they can be stored and bound as parameters
+        if hasattr(value, "to_pydatetime"):
+            return value.to_pydatetime()
+        if hasattr(value, "item"):
+            return value.item()
+        return value
+
+class SqlTemplate:
+    # A SQL file with :name placeholders, compiled once into a ? parameterized statement
+    _TOKENS = re.compile(r"""
+        (?P<skip>'(?:[^']|'')*'         # string literals, '' escapes a quote
+            |"(?:[^"]|"")*"             # quoted identifiers
+            |\[(?:[^\]]|\]\])*\]          # bracketed identifiers
+            |--[^\n]*                   # line comments
+            |/\*.*?\*/                   # block comments
+            |::)
+        |(?<![\w:@]):(?P<name>[A-Za-z_]\w*)""", re.VERBOSE | re.DOTALL)
+    _BINDABLE = (bool, int, float, decimal.Decimal, str, bytes, bytearray,
+                 datetime.datetime, datetime.date, datetime.time)
+
+    def __init__(self, text):
+        self.text = text
+        # parts are the text around each placeholder, names the placeholder at each ?
+        self.parts = []
+        self.names = []
+        position = 0
+        for match in self._TOKENS.finditer(text):
+            if match.group("name") is None:
+                continue
+            self.parts.append(text[position:match.start()])
+            self.names.append(match.group("name"))
+            position = match.end()
+        self.parts.append(text[position:])
+        self.sql = "?".join(self.parts)
+
+    def bind(self, params):
+        # Values in placeholder order, converted to types the driver binds natively
+        params = params or {}
+        missing = [name for name in dict.fromkeys(self.names) if name not in params]
+        if missing:
+            raise KeyError(f"Missing SQL parameters: {missing}")
+        return tuple(self._bindable(params[name]) for name in self.names)
+
+    def render(self, params):
+        # The old literal substitution: whole names only and quoted values; placeholders
+        # without a value are left as they are
+        params = params or {}
+        pieces = [self.parts[0]]
+        for name, part in zip(self.names, self.parts[1:]):
+            pieces.append(self._literal(params[name]) if name in params else f":{name}")
+            pieces.append(part)
+        return "".join(pieces)
+
+    @classmethod
+    def _bindable(cls, value):
+        if value is None:
+            return None
+        if getattr(value, "dtype", None) is not None and value.dtype.kind == "M":
+            value = pd.Timestamp(value)
+        # pd.NA from nullable columns (e.g. Int64) cannot be compared, so missing values are
+        # found with pd.isna; without pandas loaded a value can only be a float NaN
+        pandas = sys.modules.get("pandas")
+        if pandas is not None and pandas.api.types.is_scalar(value):
+            if pandas.isna(value):
+                return None
+        else:
+            try:
+                if value != value:
+                    return None
+            except (TypeError, ValueError):
+                pass
+        if hasattr(value, "to_pydatetime"):
+            return value.to_pydatetime()
+        if hasattr(value, "item") and not isinstance(value, cls._BINDABLE):
+            # numpy scalars
+            value = value.item()
+        if isinstance(value, uuid.UUID):
+            return str(value)
+        if not isinstance(value, cls._BINDABLE):
+            raise TypeError(f"Cannot bind a {type(value).__name__} as a SQL parameter")
+        return value
+
+    @classmethod
+    def _literal(cls, value):
+        value = cls._bindable(value)
+        if value is None:
+            return "NULL"
+        if isinstance(value, bool):
+            return "1" if value else "0"
+        if isinstance(value, (int, float, decimal.Decimal)):
+            return str(value)
+        if isinstance(value, (bytes, bytearray)):
+            return f"0x{bytes(value).hex()}"
+        if isinstance(value, datetime.datetime):
+            return f"'{value.isoformat(sep=' ', timespec='milliseconds')}'"
+        if isinstance(value, (datetime.date, datetime.time)):
+            return f"'{value.isoformat()}'"
+        return "N'" + value.replace("'", "''") + "'"
+
+class SqlTemplateCache:
+    # Compiled SQL files keyed by path, recompiled when the file changes on disk
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "reloads": 0}
+
+    def get(self, sql_file_path):
+        path = os.path.abspath(sql_file_path)
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(path)
+                self._counters["hits"] += 1
+                return entry[1]
+        with open(path, 'r') as f:
+            template = SqlTemplate(f.read())
+        with self._lock:
+            self._counters["reloads" if entry is not None else "misses"] += 1
+            self._entries[path] = (signature, template)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return template
+
+    def invalidate(self, sql_file_path=None):
+        with self._lock:
+            if sql_file_path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(os.path.abspath(sql_file_path), None)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = len(self._entries)
+        return stats
+
+# Shared by every SqlOperations instance in the process unless one is passed in
+default_sql_template_cache = SqlTemplateCache()
 
 class SqlOperations:
-    def __init__(self, DRIVER, SERVER_NAME, DATABASE_NAME, USERNAME, PASSWORD):
+    def __init__(self, DRIVER, SERVER_NAME, DATABASE_NAME, USERNAME, PASSWORD, pool=None, schema_cache=None,
+                 template_cache=None):
         # Create a connection string
         self.connection_string = f"""DRIVER={{{DRIVER}}};
                             SERVER={SERVER_NAME};
                             DATABASE={DATABASE_NAME};
                             UID={USERNAME};
                             PWD={PASSWORD}"""
+        self.database = DATABASE_NAME
+        # pool may be a shared ConnectionPool or the max size of a private one
+        if isinstance(pool, int) and not isinstance(pool, bool):
+            pool = ConnectionPool(self.connection_string, max_size=pool)
+        self.pool = pool
+        self.schema_cache = schema_cache if schema_cache is not None else default_schema_cache
+        self.template_cache = template_cache if template_cache is not None else default_sql_template_cache
+        # Connections and sessions are tracked per thread so one instance can be shared
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        return getattr(self._local, "connection", None)
+
+    @connection.setter
+    def connection(self, value):
+        self._local.connection = value
 
     def create_connection(self):
-        # Connect to the database
-        self.connection = pyodbc.connect(self.connection_string)
+        # Connect to the database, reusing the open session or a pooled connection
+        session = self._session_connection()
+        if session is not None:
+            self.connection = session
+        elif self.pool is not None:
+            self.connection = self.pool.acquire()
+        else:
+            self.connection = pyodbc.connect(self.connection_string)
 
     def close_connection(self):
-        # Close the database connection
-        self.connection.close()
+        # Close the database connection, or hand it back to the session/pool that owns it
+        connection = self.connection
+        if connection is None or connection is self._session_connection():
+            return
+        self.connection = None
+        self._release_connection(connection)
+
+    def _release_connection(self, connection):
+        if connection is self._session_connection():
+            return
+        if self.pool is not None:
+            self.pool.release(connection)
+        else:
+            connection.close()
+
+    @contextmanager
+    def session(self, commit=True):
+        # Run several operations on one connection and one transaction; the commit
+        # flags of the individual calls are ignored while the session is open
+        if self._session_connection() is not None:
+            yield self
+            return
+        connection = self.pool.acquire() if self.pool is not None else pyodbc.connect(self.connection_string)
+        self._local.session = connection
+        try:
+            yield self
+            if commit:
+                connection.commit()
+            else:
+                connection.rollback()
+        except BaseException:
+            try:
+                connection.rollback()
+            finally:
+                self._release_session(connection)
+            raise
+        else:
+            self._release_session(connection)
+
+    def table_schema(self, table_name):
+        self.create_connection()
+        cursor = self.connection.cursor()
+        try:
+            return self._table_schema(cursor, table_name)
+        finally:
+            cursor.close()
+            self.close_connection()
+
+    def invalidate_schema(self, table_name=None):
+        # Call after DDL so the next load sees the new columns
+        self.schema_cache.invalidate(table_name, scope=self.connection_string if table_name else None)
+
+    def _table_schema(self, cursor, table_name):
+        return self.schema_cache.get(cursor, table_name, scope=self.connection_string)
+
+    def pool_stats(self):
+        return self.pool.stats() if self.pool is not None else None
+
+    def _session_connection(self):
+        return getattr(self._local, "session", None)
+
+    def _release_session(self, connection):
+        self._local.session = None
+        self.connection = None
+        if self.pool is not None:
+            self.pool.release(connection)
+        else:
+            connection.close()
+
+    def _begin(self, cursor):
+        if self._session_connection() is None:
+            cursor.execute("BEGIN TRANSACTION;")
+
+    def _end(self, cursor, commit):
+        # Inside a session the transaction is finished by the session itself
+        if self._session_connection() is not None:
+            return
+        if commit:
+            cursor.execute("COMMIT TRANSACTION;")
+        else:
+            cursor.execute("ROLLBACK TRANSACTION;")
+
+    def _abort(self, cursor):
+        if self._session_connection() is None:
+            cursor.execute("ROLLBACK TRANSACTION;")
+
+    def _finish(self, commit):
+        if self._session_connection() is not None:
+            return
+        if commit:
+            self.connection.commit()
+        else:
+            self.connection.rollback()
 
     def DB_Connection(self, connection_string):
         connection = None
@@ -110,59 +946,220 @@ class SqlOperations:
             else:
                 print("UNABLE TO ESTABLISH CONNECTION")
 
-    def Execute_SQL(self, connection_string=None, sql_statement=None, commit=False):
+    def Execute_SQL(self, connection_string=None, sql_statement=None, commit=False, params=None):
+        return self._execute_sql(connection_string, sql_statement, commit, params,
+                                 telemetry.start("sql.execute_sql", database=self.database))
+
+    def _execute_sql(self, connection_string, sql_statement, commit, params, span):
+        session = self._session_connection()
+        pooled = session is None and self.pool is not None and connection_string in (None, self.connection_string)
+        conn = cursor = None
         try:
-            conn = self.DB_Connection(connection_string)
-            cursor = conn.cursor()
-            cursor.execute(sql_statement)
-            if commit:
-                conn.commit()
+            if session is not None:
+                conn = session
+            elif pooled:
+                conn = self.pool.acquire()
             else:
-                conn.rollback()
+                conn = self.DB_Connection(connection_string)
+            cursor = conn.cursor()
+            cursor.execute(sql_statement, *(params or ()))
+            if session is None:
+                if commit:
+                    conn.commit()
+                else:
+                    conn.rollback()
             print("statement executed without error")
         except Exception as e:
+            span.fail(e)
             print(f"SCRIPT FAILURE HAS OCCURED ->\n{e}\n")
-            conn.rollback()
+            # Let the session roll back everything rather than committing partial work
+            if session is not None:
+                raise
+            if conn is not None:
+                conn.rollback()
         finally:
-            cursor.close()
-            conn.close()
+            if cursor is not None:
+                cursor.close()
+            if session is None and conn is not None:
+                if pooled:
+                    self.pool.release(conn)
+                else:
+                    conn.close()
+            span.finish()
 
-    def read_data(self, sql_statement, commit=False):
+    def read_data(self, sql_statement, commit=False, params=None):
+        span = telemetry.start("sql.read_data", database=self.database)
         # Create a connection and cursor
         self.create_connection()
         cursor = self.connection.cursor()
         try:
             # Start a transaction
-            cursor.execute("BEGIN TRANSACTION;")
-            # Select data using the provided SQL statement
-            cursor.execute(sql_statement)
+            self._begin(cursor)
+            # Select data using the provided SQL statement and its ? parameters
+            cursor.execute(sql_statement, *(params or ()))
             data = cursor.fetchall()
+            span.add(rows_read=len(data))
             # Get the column names from the cursor description
-            column_names = [column[0] for column in cursor.description]
+            column_names = self._column_names(cursor)
             # Commit or rollback the transaction based on the commit parameter
-            if commit:
-                cursor.execute("COMMIT TRANSACTION;")
-            else:
-                cursor.execute("ROLLBACK TRANSACTION;")
+            self._end(cursor, commit)
             return pd.DataFrame([list(record) for record in data], columns=column_names)
         except Exception as e:
+            span.fail(e)
             # Rollback the transaction if an error occurs
-            cursor.execute("ROLLBACK TRANSACTION;")
+            self._abort(cursor)
             raise e
         finally:
             # Close the cursor and database connection
             cursor.close()
             self.close_connection()
+            span.finish()
+
+    def read_data_chunks(self, sql_statement, chunk_size=50000, commit=False, skip_rows=0, resumable=False):
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be a positive number of rows")
+        # resumable (True or a checkpoint name) records in the run journal how many rows the
+        # consumer has finished with, so a rerun of the same job starts after them
+        checkpoint = self._checkpoint_name(resumable, "read_data_chunks",
+                                           hashlib.sha1(sql_statement.encode()).hexdigest()[:12])
+        if checkpoint:
+            skip_rows = journal.last_checkpoint(checkpoint, skip_rows)
+        consumed = skip_rows
+        # The span stays open while the consumer works through the chunks
+        span = telemetry.start("sql.read_data_chunks", database=self.database, chunk_size=chunk_size)
+        connection = cursor = None
+        try:
+            # Create a connection and cursor inside the try, so a failed connect still ends the span
+            self.create_connection()
+            # Keep a local handle so other calls made while the generator is paused
+            # cannot swap the connection out from under it
+            connection = self.connection
+            cursor = connection.cursor()
+            # Start a transaction
+            self._begin(cursor)
+            # Select data using the provided SQL statement
+            cursor.execute(sql_statement)
+            column_names = self._column_names(cursor)
+            dtypes = self._column_dtypes(cursor)
+            # Rows already handled before a restart are fetched again but not handed out
+            while skip_rows > 0:
+                rows = cursor.fetchmany(min(chunk_size, skip_rows))
+                if not rows:
+                    break
+                skip_rows -= len(rows)
+            # Only chunk_size rows are held in memory at any time
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                span.add(rows_read=len(rows), chunks=1)
+                yield self._frame_from_rows(rows, column_names, dtypes)
+                # The consumer asked for the next chunk, so it is done with this one
+                consumed += len(rows)
+                if checkpoint:
+                    journal.checkpoint(checkpoint, consumed)
+            # Commit or rollback the transaction based on the commit parameter
+            self._end(cursor, commit)
+        except BaseException as e:
+            if not isinstance(e, GeneratorExit):
+                span.fail(e)
+            # Rollback the transaction if an error occurs or the consumer stops early
+            if cursor is not None:
+                self._abort(cursor)
+            raise
+        finally:
+            # Close the cursor and database connection
+            if cursor is not None:
+                cursor.close()
+            if connection is not None:
+                if self.connection is connection:
+                    self.connection = None
+                self._release_connection(connection)
+            span.finish()
 
-    def insert_data(self, table_name, data, commit=False):
+    def export_data(self, sql_statement, sink_path, chunk_size=50000, file_format=None, sep="\t", commit=False,
+                    resumable=False):
+        file_format = (file_format or str(sink_path).split('.')[-1]).lower()
+        if file_format not in ('csv', 'txt', 'parquet'):
+            raise ValueError(f"Unsupported sink format: {file_format}. Use csv, txt or parquet.")
+        # resumable (True or a checkpoint name) records every chunk written in the run journal,
+        # so a rerun of the same job carries on from the last complete chunk
+        checkpoint = self._checkpoint_name(resumable, "export_data", sink_path)
+        if checkpoint and file_format == 'parquet':
+            raise ValueError("Parquet files cannot be appended to, so parquet exports cannot be resumed")
+        rows_written = 0
+        done = journal.last_checkpoint(checkpoint) if checkpoint else None
+        if done and os.path.exists(sink_path):
+            # Drop whatever was written after the last checkpoint, then keep appending
+            with open(sink_path, 'r+b') as f:
+                f.truncate(done["bytes"])
+            rows_written = done["rows"]
+        writer = None
+        try:
+            for chunk in self.read_data_chunks(sql_statement, chunk_size=chunk_size, commit=commit,
+                                               skip_rows=rows_written):
+                if file_format == 'parquet':
+                    import pyarrow as pa
+                    import pyarrow.parquet as pq
+                    # The schema of the first chunk is kept for the whole file
+                    if writer is None:
+                        table = pa.Table.from_pandas(chunk, preserve_index=False)
+                        writer = pq.ParquetWriter(sink_path, table.schema)
+                    else:
+                        table = pa.Table.from_pandas(chunk, schema=writer.schema, preserve_index=False)
+                    writer.write_table(table)
+                else:
+                    chunk.to_csv(sink_path, sep=',' if file_format == 'csv' else sep, index=False,
+                                 mode='w' if rows_written == 0 else 'a', header=rows_written == 0)
+                rows_written += len(chunk)
+                if checkpoint:
+                    journal.checkpoint(checkpoint, {"rows": rows_written, "bytes": os.path.getsize(sink_path)})
+        finally:
+            if writer is not None:
+                writer.close()
+        return rows_written
+
+    @staticmethod
+    def _checkpoint_name(resumable, operation, target):
+        if not resumable:
+            return None
+        return journal.claim(resumable if isinstance(resumable, str) else f"{operation}:{target}")
+
+    @staticmethod
+    def _column_names(cursor):
+        return [column[0] for column in cursor.description]
+
+    @staticmethod
+    def _column_dtypes(cursor):
+        # Map the Python type the driver reports for each column to a pandas dtype,
+        # so every chunk comes back with the same dtypes even when it is all NULL
+        type_map = {int: 'Int64', float: 'float64', bool: 'boolean',
+                    str: 'object', datetime.datetime: 'datetime64[ns]'}
+        return {column[0]: type_map.get(column[1], 'object') for column in cursor.description}
+
+    @staticmethod
+    def _frame_from_rows(rows, column_names, dtypes):
+        frame = pd.DataFrame.from_records([tuple(row) for row in rows], columns=column_names)
+        for column, dtype in dtypes.items():
+            if dtype == 'object' or str(frame[column].dtype) == dtype:
+                continue
+            try:
+                frame[column] = frame[column].astype(dtype)
+            except (TypeError, ValueError, OverflowError):
+                # Leave values the dtype cannot represent (e.g. out of range dates) as objects
+                pass
+        return frame
+
+    def insert_data(self, table_name, data, commit=False, bulk=False, batch_size=10000, resumable=False):
+        # Only the batched path can resume, so resumable loads always take it
+        if bulk or resumable:
+            return self.bulk_insert_data(table_name, data, batch_size=batch_size, commit=commit, resumable=resumable)
+        span = telemetry.start("sql.insert_data", database=self.database, table=table_name)
         self.create_connection()
         cursor = self.connection.cursor()
-        # Start a transaction
-        cursor.execute("BEGIN TRANSACTION;")
         try:
             # Get the column names for the table
-            cursor.execute(f"SELECT TOP 1 * FROM {table_name}")
-            columns = [f"[{column[0]}]" for column in cursor.description]
+            columns = [f"[{column}]" for column in self._table_schema(cursor, table_name).columns]
             column_list = ', '.join(columns)
             outerstring = []
             for record in data.values.tolist():
@@ -176,28 +1173,123 @@ class SqlOperations:
             value_list = ",".join(outerstring)
             query = f"INSERT INTO {table_name} ({column_list}) VALUES {value_list}"
             print(query)
-            self.Execute_SQL(
-                connection_string=self.connection_string, sql_statement=query, commit=commit)
+            # Run on the connection already held, so a pool of one cannot deadlock against itself
+            cursor.execute(query)
+            self._finish(commit)
+            span.add(rows_written=len(outerstring))
         except Exception as e:
             print(e)
+            span.fail(e)
             # Rollback the transaction if an error occurs
-            cursor.execute("ROLLBACK TRANSACTION;")
+            self._finish(False)
             raise
         finally:
-            # Close the database connection
+            # Close the cursor and database connection
+            cursor.close()
             self.close_connection()
+            span.finish()
 
-    def update_data(self, table_name, data, unique_code_field, commit=False):
+    def bulk_insert_data(self, table_name, data, batch_size=10000, commit=False, fast_executemany=True,
+                         resumable=False):
+        if batch_size < 1:
+            raise ValueError("batch_size must be a positive number of rows")
+        # resumable (True or a checkpoint name) commits every batch and records it in the run
+        # journal, so a rerun of the same job skips rows that were already loaded. A crash
+        # between a commit and its checkpoint loads that one batch again.
+        checkpoint = self._checkpoint_name(resumable, "bulk_insert_data", table_name)
+        if checkpoint and (not commit or self._session_connection() is not None):
+            raise ValueError("Resumable loads commit every batch; pass commit=True and do not run inside a session")
+        skipped = journal.last_checkpoint(checkpoint, 0) if checkpoint else 0
+        if skipped:
+            print(f"Resuming the load into {table_name} after {skipped} rows")
+            data = data.iloc[skipped:] if isinstance(data, pd.DataFrame) else data[skipped:]
+        self.create_connection()
+        cursor = self.connection.cursor()
+        # Send the rows as parameter arrays instead of one literal per value
+        cursor.fast_executemany = fast_executemany
+        rows_loaded = 0
+        start = time.perf_counter()
+        span = telemetry.start("sql.bulk_insert_data", database=self.database, table=table_name)
+        try:
+            # Get the column names for the table from the schema cache
+            schema = self._table_schema(cursor, table_name)
+            columns = self._match_columns(schema.columns, data)
+            query = self._insert_statement(table_name, columns)
+            # Every batch runs on this connection, so the whole load is one transaction
+            for batch in self._row_batches(data, batch_size, schema, columns):
+                cursor.executemany(query, batch)
+                rows_loaded += len(batch)
+                if checkpoint:
+                    self.connection.commit()
+                    journal.checkpoint(checkpoint, skipped + rows_loaded)
+            self._finish(commit)
+            span.add(rows_written=rows_loaded)
+        except Exception as e:
+            print(e)
+            span.fail(e)
+            # Rollback the transaction if an error occurs
+            self._finish(False)
+            raise
+        finally:
+            # Close the cursor and database connection
+            cursor.close()
+            self.close_connection()
+            span.finish()
+        elapsed = time.perf_counter() - start
+        stats = {"table": table_name,
+                 "rows": rows_loaded,
+                 "seconds": round(elapsed, 3),
+                 "rows_per_sec": round(rows_loaded / elapsed, 1) if elapsed > 0 else float(rows_loaded),
+                 "committed": commit,
+                 "resumed_after": skipped}
+        print(f"Loaded {rows_loaded} rows into {table_name} in {elapsed:.2f}s ({stats['rows_per_sec']:,.0f} rows/sec)")
+        return stats
+
+    @staticmethod
+    def _match_columns(table_columns, data):
+        # Use the DataFrame's own column names when they all exist in the table,
+        # otherwise fall back to matching the table's columns by position
+        if isinstance(data, pd.DataFrame):
+            lookup = {column.lower(): column for column in table_columns}
+            data_columns = [str(column).lower() for column in data.columns]
+            if all(column in lookup for column in data_columns):
+                return [lookup[column] for column in data_columns]
+            width = len(data.columns)
+        else:
+            width = len(data[0]) if len(data) else len(table_columns)
+        if width > len(table_columns):
+            raise ValueError(f"Data has {width} columns but the table only has {len(table_columns)}")
+        return table_columns[:width]
+
+    @staticmethod
+    def _insert_statement(table_name, columns):
+        column_list = ', '.join([f"[{column}]" for column in columns])
+        placeholders = ', '.join(['?'] * len(columns))
+        return f"INSERT INTO {table_name} ({column_list}) VALUES ({placeholders})"
+
+    @staticmethod
+    def _row_batches(data, batch_size, schema, columns):
+        # Only one batch is converted to Python objects at a time, with the converters the
+        # cached schema worked out for the table's column types
+        for start in range(0, len(data), batch_size):
+            if isinstance(data, pd.DataFrame):
+                yield schema.prepare_rows(columns, data.iloc[start:start + batch_size])
+            else:
+                yield [list(row) for row in data[start:start + batch_size]]
+
+    def update_data(self, table_name, data, unique_code_field, commit=False, upsert=False,
+                    batch_size=10000, delete_missing=False):
+        if upsert:
+            return self.upsert_data(table_name, data, unique_code_field, batch_size=batch_size,
+                                    delete_missing=delete_missing, commit=commit)
         if type(data) != list:
             data = data.values.tolist()
+        span = telemetry.start("sql.update_data", database=self.database, table=table_name)
         self.create_connection()
         cursor = self.connection.cursor()
-        # Start a transaction
-        cursor.execute("BEGIN TRANSACTION;")
         try:
             # Get the column names for the table
-            cursor.execute(f"SELECT TOP 1 * FROM {table_name}")
-            columns = [f"{column[0]}" for column in cursor.description]
+            columns = list(self._table_schema(cursor, table_name).columns)
             column_list = ', '.join(columns)
             value_str = ', '.join([str(tuple(val)) for val in data])
             cols = [item for item in columns if item.lower() !=
@@ -223,56 +1315,791 @@ class SqlOperations:
             left join {table_name} prod
                 on temp.{unique_code_field} = prod.{unique_code_field};"""
             print(update_sql_statement)
-            self.Execute_SQL(connection_string=self.connection_string,
-                             sql_statement=update_sql_statement,
-                             commit=commit)
+            # Run on the connection already held, so a pool of one cannot deadlock against itself
+            cursor.execute(update_sql_statement)
+            self._finish(commit)
+            span.add(rows_written=len(data))
         except Exception as e:
             print(e)
+            span.fail(e)
             # Rollback the transaction if an error occurs
-            cursor.execute("ROLLBACK TRANSACTION;")
+            self._finish(False)
             raise
         finally:
-            # Close the database connection
+            # Close the cursor and database connection
+            cursor.close()
             self.close_connection()
+            span.finish()
 
-    def execute_sql_from_file(self, sql_file_path, params=None, parameterized=False, commit=False):
-        with open(sql_file_path, 'r') as f:
-            sql_query = f.read()
-        if parameterized and params is not None:
-            sql_query = self._replace_params(sql_query, params)
-        self.Execute_SQL(sql_statement=sql_query,
-                         connection_string=self.connection_string,
-                         commit=commit)
+    def upsert_data(self, table_name, data, key_columns=None, batch_size=10000, delete_missing=False,
+                    commit=False, fast_executemany=True):
+        if isinstance(key_columns, str):
+            key_columns = [key_columns]
+        if batch_size < 1:
+            raise ValueError("batch_size must be a positive number of rows")
+        self.create_connection()
+        cursor = self.connection.cursor()
+        cursor.fast_executemany = fast_executemany
+        stage = f"#{self._temp_table_name(table_name)}_stage"
+        actions = f"#{self._temp_table_name(table_name)}_actions"
+        start = time.perf_counter()
+        staged = 0
+        span = telemetry.start("sql.upsert_data", database=self.database, table=table_name)
+        try:
+            # Get the column names and primary key for the table from the schema cache
+            schema = self._table_schema(cursor, table_name)
+            columns = self._match_columns(schema.columns, data)
+            if key_columns is None:
+                key_columns = schema.key_columns
+            if not key_columns:
+                raise ValueError(f"Need at least one key column to upsert on; {table_name} has no primary key")
+            lookup = {column.lower(): column for column in columns}
+            missing = [key for key in key_columns if key.lower() not in lookup]
+            if missing:
+                raise ValueError(f"Key columns {missing} are not part of the data loaded into {table_name}")
+            keys = [lookup[key.lower()] for key in key_columns]
+            values = [column for column in columns if column.lower() not in {key.lower() for key in keys}]
+            column_list = ', '.join([f"[{column}]" for column in columns])
+            # Create an empty staging table with the target's column types; the UNION ALL
+            # stops SELECT INTO from copying IDENTITY so explicit key values can be loaded
+            cursor.execute(f"IF OBJECT_ID('tempdb..{stage}') IS NOT NULL DROP TABLE [{stage}];")
+            cursor.execute(f"IF OBJECT_ID('tempdb..{actions}') IS NOT NULL DROP TABLE [{actions}];")
+            cursor.execute(f"""
+        select top 0 {column_list} into [{stage}] from {table_name}
+        union all
+        select top 0 {column_list} from {table_name};""")
+            cursor.execute(f"create table [{actions}] (merge_action nvarchar(10) not null);")
+            # Load the staging table in parameterized batches
+            query = self._insert_statement(f"[{stage}]", columns)
+            for batch in self._row_batches(data, batch_size, schema, columns):
+                cursor.executemany(query, batch)
+                staged += len(batch)
+            key_list = ', '.join([f"[{key}]" for key in keys])
+            cursor.execute(f"create clustered index ix_stage_keys on [{stage}] ({key_list});")
+            cursor.execute(self._merge_statement(table_name, stage, actions, columns, keys, values, delete_missing))
+            cursor.execute(f"select merge_action, count(*) from [{actions}] group by merge_action;")
+            counts = {action.upper(): count for action, count in cursor.fetchall()}
+            cursor.execute(f"drop table [{stage}]; drop table [{actions}];")
+            self._finish(commit)
+            span.add(rows_written=staged)
+        except Exception as e:
+            print(e)
+            span.fail(e)
+            # Rollback the transaction if an error occurs
+            self._finish(False)
+            raise
+        finally:
+            # Close the cursor and database connection
+            cursor.close()
+            self.close_connection()
+            span.finish()
+        elapsed = time.perf_counter() - start
+        inserted = counts.get("INSERT", 0)
+        updated = counts.get("UPDATE", 0)
+        stats = {"table": table_name,
+                 "staged": staged,
+                 "inserted": inserted,
+                 "updated": updated,
+                 "deleted": counts.get("DELETE", 0),
+                 "unchanged": staged - inserted - updated,
+                 "seconds": round(elapsed, 3),
+                 "committed": commit}
+        print(f"Upserted {staged} rows into {table_name} in {elapsed:.2f}s: {inserted} inserted, "
+              f"{updated} updated, {stats['unchanged']} unchanged, {stats['deleted']} deleted")
+        return stats
+
+    @staticmethod
+    def _merge_statement(table_name, stage, actions, columns, keys, values, delete_missing=False):
+        on_clause = " and ".join([f"target.[{key}] = source.[{key}]" for key in keys])
+        insert_list = ', '.join([f"[{column}]" for column in columns])
+        source_list = ', '.join([f"source.[{column}]" for column in columns])
+        statement = f"""
+        merge {table_name} with (holdlock) as target
+        using [{stage}] as source
+            on {on_clause}"""
+        if values:
+            # EXCEPT compares NULLs as equal, so rows that did not change are left alone
+            changed = (f"exists (select {', '.join([f'source.[{column}]' for column in values])} "
+                       f"except select {', '.join([f'target.[{column}]' for column in values])})")
+            set_clause = ", ".join([f"target.[{column}] = source.[{column}]" for column in values])
+            statement += f"""
+        when matched and {changed} then
+            update set {set_clause}"""
+        statement += f"""
+        when not matched by target then
+            insert ({insert_list}) values ({source_list})"""
+        if delete_missing:
+            statement += """
+        when not matched by source then
+            delete"""
+        statement += f"""
+        output $action into [{actions}] (merge_action);"""
+        return statement
+
+    @staticmethod
+    def _temp_table_name(table_name):
+        # dbo.[My Table] -> my_table
+        name = table_name.split('.')[-1].strip('[]"')
+        return "".join([char if char.isalnum() else "_" for char in name.lower()])
+
+    @contextmanager
+    def incremental(self, source, sql_statement, watermark_column, store, initial=None, lookback=None, commit=False):
+        # Yields the rows of sql_statement whose watermark_column (rowversion, modified date or
+        # identity) is past the last saved watermark for source. The new watermark is saved
+        # only when the with block finishes without an error, so a failed write is retried on
+        # the next run; write with upsert_data so rows seen twice are harmless.
+        # sql_statement is used as a derived table, so it cannot have its own ORDER BY.
+        previous = store.get(source, initial)
+        query = f"select * from ({sql_statement}) as incremental_source"
+        params = []
+        if previous is not None:
+            query += f" where [{watermark_column}] > ?"
+            # lookback re-reads a window before the watermark, for modified dates written by
+            # transactions that committed after later rows were already extracted
+            params.append(previous - lookback if lookback is not None else previous)
+        query += f" order by [{watermark_column}];"
+        batch = IncrementalBatch(source, watermark_column, self.read_data(query, commit=commit, params=params), previous)
+        yield batch
+        if batch.watermark is not None and batch.watermark != previous:
+            store.set(source, watermark_column, batch.watermark, batch.rows)
+
+    def sync_incremental(self, source, sql_statement, watermark_column, target_table, store, key_columns=None,
+                         target=None, initial=None, lookback=None, batch_size=10000):
+        # Copies new and changed rows into target_table (on target, another SqlOperations, or
+        # this one), upserted on key_columns or the table's primary key. The watermark is saved
+        # after the write commits, so a crash in between re-delivers the batch; only an upsert
+        # makes that harmless, which is why there is no append mode.
+        target = target or self
+        stats = None
+        with self.incremental(source, sql_statement, watermark_column, store,
+                              initial=initial, lookback=lookback) as batch:
+            if batch.rows:
+                stats = target.upsert_data(target_table, batch.data, key_columns=key_columns,
+                                           batch_size=batch_size, commit=True)
+        print(f"{source}: {batch.rows} new or changed rows, watermark {batch.previous_watermark!r} -> {batch.watermark!r}")
+        return {"source": source,
+                "rows": batch.rows,
+                "previous_watermark": batch.previous_watermark,
+                "watermark": batch.watermark,
+                "write": stats}
+
+    def execute_sql_from_file(self, sql_file_path, params=None, parameterized=False, commit=False, prepared=True):
+        # The file is read and compiled once, then reused until it changes on disk
+        template = self.template_cache.get(sql_file_path)
+        values = None
+        if not parameterized or params is None:
+            sql_query = template.text
+        elif prepared:
+            # :name placeholders are sent as ? parameters, so every call has the same statement
+            # text and the server reuses its plan
+            sql_query = template.sql
+            values = template.bind(params)
+        else:
+            sql_query = template.render(params)
+        self._execute_sql(self.connection_string, sql_query, commit, values,
+                          telemetry.start("sql.execute_sql_from_file", database=self.database,
+                                          file=os.path.basename(sql_file_path), prepared=values is not None))
+
+    def execute_sql_from_file_many(self, sql_file_path, param_sets, commit=False, batch_size=10000,
+                                   fast_executemany=True):
+        # Runs one template for every parameter set (a list of dicts, or a DataFrame whose
+        # columns are the parameter names) through executemany, all in one transaction
+        if batch_size < 1:
+            raise ValueError("batch_size must be a positive number of rows")
+        template = self.template_cache.get(sql_file_path)
+        if isinstance(param_sets, pd.DataFrame):
+            param_sets = param_sets.to_dict('records')
+        self.create_connection()
+        cursor = self.connection.cursor()
+        cursor.fast_executemany = fast_executemany
+        executed = 0
+        span = telemetry.start("sql.execute_sql_from_file_many", database=self.database,
+                               file=os.path.basename(sql_file_path))
+        try:
+            for start in range(0, len(param_sets), batch_size):
+                rows = [template.bind(params) for params in param_sets[start:start + batch_size]]
+                cursor.executemany(template.sql, rows)
+                executed += len(rows)
+            self._finish(commit)
+            span.add(rows_written=executed)
+        except Exception as e:
+            print(e)
+            span.fail(e)
+            # Rollback the transaction if an error occurs
+            self._finish(False)
+            raise
+        finally:
+            # Close the cursor and database connection
+            cursor.close()
+            self.close_connection()
+            span.finish()
+        return executed
 
     def _replace_params(self, sql_query, params):
-        for key, value in params.items():
-            sql_query = sql_query.replace(f':{key}', str(value))
-        return sql_query
+        # Whole placeholder names only, so :id no longer clobbers :id2, and values are quoted
+        return SqlTemplate(sql_query).render(params)
 
 class FileReader:
     @staticmethod
-    def READ(file_path, excel_tab="Sheet1", sep="\t"):
+    def READ(file_path, excel_tab="Sheet1", sep="\t", usecols=None, dtype=None, cache=None):
+        if cache is not None:
+            # A miss shows up as a file.read span nested under this one
+            with telemetry.span("file.read_cached", file=os.path.basename(file_path)) as span:
+                df = cache.read(file_path, excel_tab=excel_tab, sep=sep, usecols=usecols, dtype=dtype)
+                span.add(rows_read=len(df))
+            return df
+        with telemetry.span("file.read", file=os.path.basename(file_path)) as span:
+            df = FileReader._parse(file_path, excel_tab, sep, usecols, dtype)
+            span.add(rows_read=len(df), bytes_read=os.path.getsize(file_path))
+        return df
+
+    @staticmethod
+    def _parse(file_path, excel_tab="Sheet1", sep="\t", usecols=None, dtype=None):
         file_extension = file_path.split('.')[-1].lower()
+        # Only pass the projection/dtype options on when they are given
+        options = {key: value for key, value in (('usecols', usecols), ('dtype', dtype)) if value is not None}
         if file_extension == 'csv':
-            df = pd.read_csv(file_path)
+            df = pd.read_csv(file_path, **options)
         elif file_extension == 'txt':
-            df = pd.read_csv(file_path, sep=sep)
+            df = pd.read_csv(file_path, sep=sep, **options)
         elif file_extension in ['xls', 'xlsx']:
             if excel_tab is None:
-                df = pd.read_excel(file_path)
+                df = pd.read_excel(file_path, **options)
             else:
-                df = pd.read_excel(file_path, sheet_name=excel_tab)
+                df = pd.read_excel(file_path, sheet_name=excel_tab, **options)
         elif file_extension == 'json':
-            df = pd.read_json(file_path)
+            df = FileReader._project(pd.read_json(file_path, **({'dtype': dtype} if dtype is not None else {})), usecols)
         elif file_extension == 'xml':
-            df = pd.read_xml(file_path)
+            df = FileReader._project(pd.read_xml(file_path, **({'dtype': dtype} if dtype is not None else {})), usecols)
         elif file_extension == 'dbf':
-            df = pd.DataFrame([_ for _ in DBF(file_path)])
+            # Without a chunk size the whole table comes back as a single frame
+            df = next(FileReader._iter_dbf(file_path, None, usecols, dtype))
         else:
             raise ValueError(
                 f'Unsupported file type: {file_extension}. Ask Immanuel to add this if you really want it.')
         return df
 
+    @staticmethod
+    def READ_CHUNKS(file_path, chunksize=100000, sep="\t", usecols=None, dtype=None):
+        if chunksize < 1:
+            raise ValueError("chunksize must be a positive number of rows")
+        file_extension = file_path.split('.')[-1].lower()
+        options = {key: value for key, value in (('usecols', usecols), ('dtype', dtype)) if value is not None}
+        if file_extension in ['csv', 'txt']:
+            with pd.read_csv(file_path, sep=',' if file_extension == 'csv' else sep,
+                             chunksize=chunksize, **options) as reader:
+                yield from reader
+        elif file_extension in ['json', 'jsonl', 'ndjson']:
+            # Only line-delimited JSON can be read a piece at a time
+            with pd.read_json(file_path, lines=True, chunksize=chunksize,
+                              **({'dtype': dtype} if dtype is not None else {})) as reader:
+                for chunk in reader:
+                    yield FileReader._project(chunk, usecols)
+        elif file_extension == 'dbf':
+            yield from FileReader._iter_dbf(file_path, chunksize, usecols, dtype)
+        else:
+            raise ValueError(
+                f'Streaming is not supported for {file_extension} files. Use READ for this file type.')
+
+    @staticmethod
+    def _project(df, usecols):
+        if usecols is None:
+            return df
+        missing = [column for column in usecols if column not in df.columns]
+        if missing:
+            raise ValueError(f"Columns {missing} are not in the file")
+        return df[list(usecols)]
+
+    @staticmethod
+    def _iter_dbf(file_path, chunksize, usecols, dtype):
+        # Records come back as (name, value) pairs and go straight into one list per
+        # column, skipping the per-record OrderedDict dbfread builds by default
+        table = dbfread.DBF(file_path, load=False, recfactory=None)
+        names = table.field_names
+        if usecols is None:
+            keep = list(range(len(names)))
+        else:
+            lookup = {name.lower(): index for index, name in enumerate(names)}
+            missing = [column for column in usecols if column.lower() not in lookup]
+            if missing:
+                raise ValueError(f"Columns {missing} are not in the file")
+            keep = [lookup[column.lower()] for column in usecols]
+        columns = [names[index] for index in keep]
+        buffers = [[] for _ in keep]
+        rows = 0
+        for record in table:
+            for buffer, index in zip(buffers, keep):
+                buffer.append(record[index][1])
+            rows += 1
+            if chunksize is not None and rows == chunksize:
+                yield FileReader._dbf_frame(columns, buffers, dtype)
+                buffers = [[] for _ in keep]
+                rows = 0
+        if rows or chunksize is None:
+            yield FileReader._dbf_frame(columns, buffers, dtype)
+
+    @staticmethod
+    def _dbf_frame(columns, buffers, dtype):
+        df = pd.DataFrame(dict(zip(columns, buffers)), columns=columns)
+        return df.astype(dtype) if dtype is not None else df
+
+    @staticmethod
+    def READ_MANY(file_paths, excel_tab="Sheet1", sep="\t", all_sheets=False, max_workers=None, concat=True):
+        tasks = FileReader._read_tasks(file_paths, excel_tab, all_sheets)
+        if not tasks:
+            raise ValueError(f"No files matched {file_paths}")
+        results = FileReader._read_concurrently(tasks, sep, max_workers)
+        if not concat:
+            # Hand back (file_path, sheet, DataFrame, seconds) tuples as each file finishes
+            return results
+        ordered = {}
+        for file_path, sheet, df, seconds in results:
+            ordered[(file_path, sheet)] = (df, seconds)
+        frames = []
+        timings = []
+        for file_path, sheet in tasks:
+            df, seconds = ordered[(file_path, sheet)]
+            frames.append(df.assign(source_file=file_path, source_sheet=sheet))
+            timings.append({"file": file_path, "sheet": sheet, "rows": len(df), "seconds": round(seconds, 3)})
+        combined = pd.concat(frames, ignore_index=True)
+        combined.attrs["read_timings"] = timings
+        return combined
+
+    @staticmethod
+    def _read_tasks(file_paths, excel_tab, all_sheets):
+        if isinstance(file_paths, (str, Path)):
+            file_paths = [file_paths]
+        paths = []
+        for pattern in file_paths:
+            pattern = str(pattern)
+            matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+            paths.extend([match for match in matches if match not in paths])
+        tasks = []
+        for file_path in paths:
+            if file_path.split('.')[-1].lower() not in ['xls', 'xlsx']:
+                tasks.append((file_path, None))
+            elif all_sheets or isinstance(excel_tab, list):
+                # One task per sheet so the sheets of a big workbook are parsed in parallel too
+                if all_sheets:
+                    # Close the workbook straight away; an open handle keeps the file locked on Windows
+                    with pd.ExcelFile(file_path) as workbook:
+                        sheets = workbook.sheet_names
+                else:
+                    sheets = excel_tab
+                tasks.extend([(file_path, sheet) for sheet in sheets])
+            else:
+                tasks.append((file_path, excel_tab))
+        return tasks
+
+    @staticmethod
+    def _read_concurrently(tasks, sep, max_workers):
+        max_workers = min(max_workers or os.cpu_count() or 1, len(tasks))
+        if max_workers == 1:
+            for file_path, sheet in tasks:
+                yield _read_file_task(file_path, sheet, sep)
+            return
+        # Parsing is CPU bound and holds the GIL, so every file gets its own process
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(_read_file_task, file_path, sheet, sep) for file_path, sheet in tasks]
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    yield future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+
+class ParsedFileCache:
+    def __init__(self, cache_dir, max_bytes=2 * 1024 ** 3, use_hash=False, file_format="pickle"):
+        if file_format not in ("pickle", "feather", "parquet"):
+            raise ValueError("file_format must be pickle, feather or parquet")
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.use_hash = use_hash
+        self.file_format = file_format
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "errors": 0}
+
+    def read(self, file_path, **read_options):
+        key = self._key(file_path, read_options)
+        entry = self._find(key)
+        if entry is not None:
+            try:
+                df = self._load(entry)
+                # Touch the entry so eviction sees it as recently used
+                os.utime(entry)
+                self._count("hits")
+                return df
+            except Exception as e:
+                # A corrupt or half-written entry is just a miss
+                print(f"Discarding unreadable cache entry {entry.name}: {e}")
+                self._count("errors")
+                entry.unlink(missing_ok=True)
+        self._count("misses")
+        df = FileReader.READ(file_path, **read_options)
+        try:
+            self._store(key, df)
+        except Exception as e:
+            print(f"Could not cache {file_path}: {e}")
+            self._count("errors")
+        return df
+
+    def clear(self):
+        # Entries for files that changed are never hit again and age out on their own
+        for entry in self._entries():
+            entry.unlink(missing_ok=True)
+
+    def stats(self):
+        entries = self._entries()
+        with self._lock:
+            stats = dict(self._counters)
+        stats["entries"] = len(entries)
+        stats["bytes"] = sum([entry.stat().st_size for entry in entries])
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
+    def _key(self, file_path, read_options):
+        stat = os.stat(file_path)
+        identity = {"path": os.path.abspath(file_path),
+                    "size": stat.st_size,
+                    "mtime": stat.st_mtime_ns,
+                    "options": read_options}
+        if self.use_hash:
+            digest = hashlib.sha256()
+            with open(file_path, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(block)
+            identity["sha256"] = digest.hexdigest()
+        return hashlib.sha256(json.dumps(identity, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _find(self, key):
+        for extension in ("pkl", "feather", "parquet"):
+            entry = self.cache_dir / f"{key}.{extension}"
+            if entry.exists():
+                return entry
+        return None
+
+    def _entries(self):
+        return [entry for entry in self.cache_dir.glob("*.*")
+                if entry.suffix in (".pkl", ".feather", ".parquet")]
+
+    @staticmethod
+    def _load(entry):
+        if entry.suffix == ".feather":
+            return pd.read_feather(entry)
+        if entry.suffix == ".parquet":
+            return pd.read_parquet(entry)
+        with open(entry, 'rb') as f:
+            return pickle.load(f)
+
+    def _store(self, key, df):
+        # Columnar formats need a plain DataFrame with string column names and a default
+        # index; anything else (e.g. a dict of sheets) is pickled
+        columnar = (self.file_format != "pickle" and isinstance(df, pd.DataFrame)
+                    and all(isinstance(column, str) for column in df.columns)
+                    and df.index.equals(pd.RangeIndex(len(df))))
+        extension = self.file_format if columnar else "pkl"
+        entry = self.cache_dir / f"{key}.{extension}"
+        partial = self.cache_dir / f"{key}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            if extension == "feather":
+                df.to_feather(partial)
+            elif extension == "parquet":
+                df.to_parquet(partial, index=False)
+            else:
+                with open(partial, 'wb') as f:
+                    pickle.dump(df, f, protocol=5)
+            # Readers only ever see complete entries
+            os.replace(partial, entry)
+        finally:
+            partial.unlink(missing_ok=True)
+        self._count("stores")
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for entry in self._entries():
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+        total = sum([size for _, size, _ in entries])
+        # Least recently used entries go first
+        for _, size, entry in sorted(entries, key=lambda item: item[0]):
+            if total <= self.max_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            total -= size
+            self._count("evictions")
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+def _read_file_task(file_path, sheet, sep):
+    # Module level so it can be pickled into worker processes
+    start = time.perf_counter()
+    df = FileReader.READ(file_path, excel_tab=sheet, sep=sep)
+    return file_path, sheet, df, time.perf_counter() - start
+
+class SMTPConnectionPool:
+    def __init__(self, server="smtp.office365.com", port=587, username=None, password=None,
+                 use_tls=True, max_size=2, timeout=60, acquire_timeout=60):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.server = server
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.max_size = max_size
+        self.timeout = timeout
+        self.acquire_timeout = acquire_timeout
+        self._idle = deque()
+        self._size = 0
+        self._condition = threading.Condition()
+        self._counters = {"connects": 0, "reconnects": 0, "messages": 0, "failures": 0}
+
+    def acquire(self):
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._condition:
+            while not self._idle and self._size >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"No SMTP connection became available within {self.acquire_timeout}s")
+                self._condition.wait(remaining)
+            if self._idle:
+                return self._idle.pop()
+            self._size += 1
+        try:
+            return self._connect()
+        except Exception:
+            self._forget()
+            raise
+
+    def release(self, smtp, discard=False):
+        if discard:
+            self._forget()
+            self._quit_quietly(smtp)
+            return
+        with self._condition:
+            self._idle.append(smtp)
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self):
+        smtp = self.acquire()
+        try:
+            yield smtp
+        except (smtplib.SMTPServerDisconnected, OSError):
+            self.release(smtp, discard=True)
+            raise
+        except BaseException:
+            self.release(smtp)
+            raise
+        else:
+            self.release(smtp)
+
+    def send(self, send_from, send_to, msg):
+        with self.connection() as smtp:
+            return self.send_on(smtp, send_from, send_to, msg)
+
+    def send_on(self, smtp, send_from, send_to, msg):
+        # Servers drop idle sessions, so reconnect once and resend on the same slot
+        try:
+            refused = smtp.sendmail(send_from, send_to, msg)
+        except smtplib.SMTPServerDisconnected:
+            self._count("reconnects")
+            self._reconnect(smtp)
+            try:
+                refused = smtp.sendmail(send_from, send_to, msg)
+            except Exception:
+                self._count("failures")
+                raise
+        except Exception:
+            self._count("failures")
+            raise
+        self._count("messages")
+        return refused
+
+    def stream_on(self, smtp, send_from, recipients, message):
+        # A dropped session never accepted the message, so it is streamed again in full
+        # after reconnecting; the files are re-read, nothing is kept in memory
+        try:
+            refused = message.send(smtp, send_from, recipients)
+        except smtplib.SMTPServerDisconnected:
+            self._count("reconnects")
+            self._reconnect(smtp)
+            try:
+                refused = message.send(smtp, send_from, recipients)
+            except Exception:
+                self._count("failures")
+                raise
+        except Exception:
+            self._count("failures")
+            raise
+        self._count("messages")
+        return refused
+
+    def close_all(self):
+        with self._condition:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+        for smtp in idle:
+            self._quit_quietly(smtp)
+
+    def stats(self):
+        with self._condition:
+            stats = dict(self._counters)
+            stats.update({"size": self._size, "idle": len(self._idle)})
+        return stats
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close_all()
+
+    def _connect(self):
+        smtp = smtplib.SMTP(timeout=self.timeout)
+        self._open(smtp)
+        return smtp
+
+    def _reconnect(self, smtp):
+        self._quit_quietly(smtp)
+        self._open(smtp)
+
+    def _open(self, smtp):
+        # Forget the previous session's EHLO state so the new one negotiates from scratch
+        smtp.ehlo_resp = smtp.helo_resp = None
+        smtp.esmtp_features = {}
+        smtp.does_esmtp = False
+        smtp.connect(self.server, self.port)
+        if self.use_tls:
+            smtp.starttls()
+        if self.username:
+            smtp.login(self.username, self.password)
+        self._count("connects")
+
+    def _count(self, counter):
+        with self._condition:
+            self._counters[counter] += 1
+
+    def _forget(self):
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+    @staticmethod
+    def _quit_quietly(smtp):
+        try:
+            smtp.quit()
+        except Exception:
+            smtp.close()
+
+class StreamingMessage:
+    # Read 57 * 1024 bytes at a time so every base64 line comes out 76 characters long
+    READ_SIZE = 57 * 1024
+
+    def __init__(self, send_from, send_to, subject="", message="", attachments=(), Cc=None):
+        self.send_from = send_from
+        self.send_to = send_to
+        self.subject = subject
+        self.message = message
+        # attachments is a list of (file name shown to the recipient, path on disk)
+        self.attachments = list(attachments)
+        self.Cc = Cc
+        self.boundary = f"=={uuid.uuid4().hex}=="
+        self._head_bytes = None
+
+    def encoded_size(self):
+        # Exact size on the wire without reading any attachment
+        size = len(self._head()) + len(self._tail())
+        for name, path in self.attachments:
+            length = os.path.getsize(path)
+            size += len(self._part_head(name)) + 4 * -(-length // 3) + 2 * -(-length // 57)
+        return size
+
+    def iter_bytes(self):
+        yield self._head()
+        for name, path in self.attachments:
+            yield self._part_head(name)
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(self.READ_SIZE), b''):
+                    yield base64.encodebytes(block).replace(b"\n", b"\r\n")
+        yield self._tail()
+
+    def send(self, smtp, send_from, recipients):
+        smtp.ehlo_or_helo_if_needed()
+        size = self.encoded_size()
+        limit = int(smtp.esmtp_features.get('size') or 0)
+        if limit and size > limit:
+            raise ValueError(f"Message is {size} bytes but the server only accepts {limit}")
+        options = [f"SIZE={size}"] if smtp.has_extn('size') else []
+        code, response = smtp.mail(send_from, options)
+        if code != 250:
+            smtp.rset()
+            raise smtplib.SMTPSenderRefused(code, response, send_from)
+        refused = {}
+        for recipient in recipients:
+            code, response = smtp.rcpt(recipient)
+            if code not in (250, 251):
+                refused[recipient] = (code, response)
+        if len(refused) == len(recipients):
+            smtp.rset()
+            raise smtplib.SMTPRecipientsRefused(refused)
+        code, response = smtp.docmd("DATA")
+        if code != 354:
+            smtp.rset()
+            raise smtplib.SMTPDataError(code, response)
+        # Write straight to the socket one block at a time instead of building the whole message
+        for block in self.iter_bytes():
+            smtp.sock.sendall(re.sub(rb"(?m)^\.", b"..", block))
+        smtp.sock.sendall(b".\r\n")
+        code, response = smtp.getreply()
+        if code != 250:
+            raise smtplib.SMTPDataError(code, response)
+        return refused
+
+    def _head(self):
+        # Built once so the Date and Message-ID the size was computed with are the ones sent
+        if self._head_bytes is None:
+            self._head_bytes = self._build_head()
+        return self._head_bytes
+
+    def _build_head(self):
+        subject = self.subject if self.subject.isascii() else Header(self.subject, 'utf-8').encode()
+        headers = [f"From: {self.send_from}",
+                   f"To: {COMMASPACE.join(self.send_to) if type(self.send_to) == list else self.send_to}"]
+        if self.Cc:
+            headers.append(f"Cc: {COMMASPACE.join(self.Cc) if type(self.Cc) == list else self.Cc}")
+        headers += [f"Date: {formatdate(localtime=True)}",
+                    f"Subject: {subject}",
+                    f"Message-ID: {make_msgid()}",
+                    "MIME-Version: 1.0",
+                    f'Content-Type: multipart/mixed; boundary="{self.boundary}"',
+                    "",
+                    f"--{self.boundary}",
+                    MIMEText(self.message).as_string()]
+        return self._crlf("\n".join(headers) + "\n")
+
+    def _part_head(self, name):
+        return self._crlf(f"--{self.boundary}\n"
+                          "Content-Type: application/octet-stream\n"
+                          "MIME-Version: 1.0\n"
+                          "Content-Transfer-Encoding: base64\n"
+                          f'Content-Disposition: attachment; filename="{name}"\n\n')
+
+    def _tail(self):
+        return self._crlf(f"--{self.boundary}--\n")
+
+    @staticmethod
+    def _crlf(text):
+        return text.replace("\r\n", "\n").replace("\n", "\r\n").encode()
+
 class EmailSender:
     @staticmethod
     def send_mail(send_from='admin@company.com', send_to=[],
@@ -280,13 +2107,34 @@ class EmailSender:
                   files=[], server="smtp.office365.com",
                   port=587, username=None,
                   password=None, use_tls=True,
-                  Bcc=None, Cc=None):
+                  Bcc=None, Cc=None, pool=None):
         if not send_to or type(send_to) not in (str,list):
             raise ValueError("Need valid recipients")
-        if not username or type(username) != str:
-            raise ValueError("Need valid username")
-        if not password or type(password) != str:
-            raise ValueError("Need valid password")
+        # A pool carries its own credentials
+        if pool is None:
+            if not username or type(username) != str:
+                raise ValueError("Need valid username")
+            if not password or type(password) != str:
+                raise ValueError("Need valid password")
+        msg = EmailSender.build_message(send_from=send_from, send_to=send_to, subject=subject,
+                                        message=message, files=files, Bcc=Bcc, Cc=Cc)
+        payload = msg.as_string()
+        with telemetry.span("email.send_mail", attachments=len(files)) as span:
+            if pool is not None:
+                pool.send(send_from, send_to, payload)
+            else:
+                smtp = smtplib.SMTP(server, port)
+                if use_tls:
+                    smtp.starttls()
+                smtp.login(username, password)
+                smtp.sendmail(send_from, send_to, payload)
+                smtp.quit()
+            span.add(messages_sent=1, bytes_sent=len(payload))
+
+    @staticmethod
+    def build_message(send_from='admin@company.com', send_to=[],
+                      subject="Subject Place Holder", message="",
+                      files=[], Bcc=None, Cc=None):
         msg = MIMEMultipart()
         msg['From'] = send_from
         msg['To'] = COMMASPACE.join(send_to) if type(
@@ -303,127 +2151,841 @@ class EmailSender:
             encoders.encode_base64(part)
             part.add_header('Content-Disposition', 'attachment; filename={}'.format(Path(path).name))
             msg.attach(part)
-        smtp = smtplib.SMTP(server, port)
-        if use_tls:
-            smtp.starttls()
-        smtp.login(username, password)
-        smtp.sendmail(send_from, send_to, msg.as_string())
-        smtp.quit()
+        return msg
+
+    @staticmethod
+    def send_batch(messages, pool=None, server="smtp.office365.com", port=587,
+                   username=None, password=None, use_tls=True, throttle=None):
+        # messages is a list of send_mail style dicts (send_from, send_to, subject,
+        # message, files, Bcc, Cc); throttle is the minimum number of seconds between sends
+        own_pool = pool is None
+        if own_pool:
+            pool = SMTPConnectionPool(server=server, port=port, username=username,
+                                      password=password, use_tls=use_tls, max_size=1)
+        results = []
+        last_sent = None
+        span = telemetry.start("email.send_batch", messages=len(messages))
+        try:
+            with pool.connection() as smtp:
+                for index, options in enumerate(messages):
+                    send_from = options.get('send_from', 'admin@company.com')
+                    send_to = options.get('send_to', [])
+                    result = {"index": index, "send_to": send_to, "subject": options.get('subject'),
+                              "ok": False, "seconds": 0.0, "error": None}
+                    if throttle and last_sent is not None:
+                        time.sleep(max(0.0, throttle - (time.monotonic() - last_sent)))
+                    start = time.perf_counter()
+                    try:
+                        if not send_to or type(send_to) not in (str, list):
+                            raise ValueError("Need valid recipients")
+                        msg = EmailSender.build_message(**{key: value for key, value in options.items()
+                                                           if key in ('send_from', 'send_to', 'subject', 'message',
+                                                                      'files', 'Bcc', 'Cc')})
+                        payload = msg.as_string()
+                        refused = pool.send_on(smtp, send_from, send_to, payload)
+                        result["ok"] = True
+                        span.add(messages_sent=1, bytes_sent=len(payload))
+                        if refused:
+                            result["error"] = f"Refused recipients: {refused}"
+                    except (smtplib.SMTPServerDisconnected, OSError) as e:
+                        # The connection could not be re-established, the rest of the batch would fail too
+                        result["error"] = str(e)
+                        result["seconds"] = round(time.perf_counter() - start, 4)
+                        results.append(result)
+                        raise
+                    except Exception as e:
+                        result["error"] = str(e)
+                    last_sent = time.monotonic()
+                    result["seconds"] = round(time.perf_counter() - start, 4)
+                    results.append(result)
+        except (smtplib.SMTPServerDisconnected, OSError) as e:
+            print(f"SMTP connection lost after {len(results)} of {len(messages)} messages: {e}")
+            for index in range(len(results), len(messages)):
+                results.append({"index": index, "send_to": messages[index].get('send_to'),
+                                "subject": messages[index].get('subject'), "ok": False,
+                                "seconds": 0.0, "error": "Not sent, SMTP connection lost"})
+        finally:
+            if own_pool:
+                pool.close_all()
+            span.add(messages_failed=len([result for result in results if not result["ok"]]))
+            span.finish()
+        failed = len([result for result in results if not result["ok"]])
+        print(f"Sent {len(results) - failed} of {len(results)} messages, {failed} failed")
+        return results
+
+    @staticmethod
+    def send_mail_streaming(send_from='admin@company.com', send_to=[],
+                            subject="Subject Place Holder", message="",
+                            files=[], server="smtp.office365.com",
+                            port=587, username=None,
+                            password=None, use_tls=True,
+                            Bcc=None, Cc=None, pool=None,
+                            compress_threshold=10 * 1024 * 1024, compression="zip",
+                            max_message_size=None, split_oversize=False):
+        if not send_to or type(send_to) not in (str,list):
+            raise ValueError("Need valid recipients")
+        if compression not in ("zip", "gzip", None):
+            raise ValueError("compression must be zip, gzip or None")
+        recipients = []
+        for addresses in (send_to, Cc, Bcc):
+            if addresses:
+                recipients += addresses if type(addresses) == list else [addresses]
+        temp_dir = tempfile.mkdtemp(prefix="mail_attachments_")
+        own_pool = pool is None
+        if own_pool:
+            pool = SMTPConnectionPool(server=server, port=port, username=username,
+                                      password=password, use_tls=use_tls, max_size=1)
+        span = telemetry.start("email.send_mail_streaming", attachments=len(files))
+        try:
+            attachments = [EmailSender._prepare_attachment(path, temp_dir, compress_threshold, compression)
+                           for path in files]
+            with pool.connection() as smtp:
+                smtp.ehlo_or_helo_if_needed()
+                limit = max_message_size or int(smtp.esmtp_features.get('size') or 0) or None
+                # Work out every message before any upload starts
+                messages = EmailSender._plan_messages(send_from, send_to, subject, message,
+                                                      attachments, Cc, limit, split_oversize)
+                results = []
+                for msg in messages:
+                    start = time.perf_counter()
+                    refused = pool.stream_on(smtp, send_from, recipients, msg)
+                    results.append({"subject": msg.subject, "bytes": msg.encoded_size(),
+                                    "attachments": [name for name, _ in msg.attachments],
+                                    "seconds": round(time.perf_counter() - start, 4), "refused": refused})
+                    span.add(messages_sent=1, bytes_sent=msg.encoded_size())
+        except Exception as e:
+            span.fail(e)
+            raise
+        finally:
+            if own_pool:
+                pool.close_all()
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            span.finish()
+        return results
+
+    @staticmethod
+    def _prepare_attachment(path, temp_dir, compress_threshold, compression):
+        name = Path(path).name
+        size = os.path.getsize(path)
+        # xlsx/docx/zip and images are already compressed, deflating them again only costs time
+        precompressed = Path(path).suffix.lower() in ('.zip', '.gz', '.xlsx', '.xlsm', '.docx',
+                                                      '.pptx', '.png', '.jpg', '.jpeg', '.7z')
+        if compression is None or compress_threshold is None or size <= compress_threshold or precompressed:
+            return name, path
+        if compression == "zip":
+            target = os.path.join(temp_dir, f"{name}.zip")
+            with zipfile.ZipFile(target, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+                archive.write(path, arcname=name)
+        else:
+            target = os.path.join(temp_dir, f"{name}.gz")
+            with open(path, 'rb') as source, gzip.open(target, 'wb') as archive:
+                shutil.copyfileobj(source, archive, 1024 * 1024)
+        # Keep the original when compression does not buy at least 10%
+        if os.path.getsize(target) > size * 0.9:
+            return name, path
+        return Path(target).name, target
+
+    @staticmethod
+    def _plan_messages(send_from, send_to, subject, message, attachments, Cc, limit, split_oversize):
+        single = StreamingMessage(send_from, send_to, subject, message, attachments, Cc)
+        if limit is None or single.encoded_size() <= limit:
+            return [single]
+        if not split_oversize:
+            raise ValueError(f"Message is {single.encoded_size()} bytes, over the {limit} byte limit. "
+                             "Pass split_oversize=True to send it as several messages.")
+        # Pack attachments largest first into as few messages as fit under the limit
+        groups = []
+        for attachment in sorted(attachments, key=lambda item: os.path.getsize(item[1]), reverse=True):
+            for group in groups:
+                if StreamingMessage(send_from, send_to, subject, message, group + [attachment], Cc).encoded_size() <= limit:
+                    group.append(attachment)
+                    break
+            else:
+                if StreamingMessage(send_from, send_to, subject, message, [attachment], Cc).encoded_size() > limit:
+                    raise ValueError(f"Attachment {attachment[0]} alone is over the {limit} byte limit")
+                groups.append([attachment])
+        return [StreamingMessage(send_from, send_to, f"{subject} (part {index} of {len(groups)})",
+                                 message, group, Cc)
+                for index, group in enumerate(groups, start=1)]
 
 class Scheduler:
-    def __init__(self, function_to_execute: Callable[..., Any]):
+    def __init__(self, function_to_execute: Callable[..., Any], calendar: BusinessCalendar = None):
         self.function_to_execute = function_to_execute
+        # Weekends and holidays for the business-day schedules
+        self.calendar = calendar
+
+    def schedule_cron(self, expression: str, *args: List[Any], **kwargs: Dict[Any, Any]) -> None:
+        return self._trigger('schedule_cron', {'expression': expression}, *args, **kwargs)
+
     def schedule_weekly(self, hour: int, day: int, *args: List[Any], **kwargs: Dict[Any, Any]) -> None:
-        now = datetime.datetime.now()
-        if now.weekday() == day and now.hour == hour:
-            self.function_to_execute(*args, **kwargs)
-            return "Function scheduled and triggered successfully."
-        else:
-            return "Function not triggered based on the schedule and schedule_params."
-        
+        return self._trigger('schedule_weekly', {'hour': hour, 'day': day}, *args, **kwargs)
+
     def schedule_daily(self, hour: int, *args: List[Any], **kwargs: Dict[Any, Any]) -> None:
-        now = datetime.datetime.now()
-        if now.hour == hour:
-            self.function_to_execute(*args, **kwargs)
-            return "Function scheduled and triggered successfully."
-        else:
-            return "Function not triggered based on the schedule and schedule_params."
-        
+        return self._trigger('schedule_daily', {'hour': hour}, *args, **kwargs)
+
     def schedule_weekdays(self, hour: int, *args: List[Any], **kwargs: Dict[Any, Any]) -> None:
-        now = datetime.datetime.now()
-        if now.weekday() < 5 and now.hour == hour:
-            self.function_to_execute(*args, **kwargs)
-            return "Function scheduled and triggered successfully."
-        else:
-            return "Function not triggered based on the schedule and schedule_params."
-        
+        return self._trigger('schedule_weekdays', {'hour': hour}, *args, **kwargs)
+
     def schedule_biweekly_even(self, hour: int, days: List[int], *args: List[Any], **kwargs: Dict[Any, Any]) -> None:
-        now = datetime.datetime.now()
-        if now.weekday() in days and now.hour == hour and (now.isocalendar()[1] % 2) == 0:
-            self.function_to_execute(*args, **kwargs)
-            return "Function scheduled and triggered successfully."
-        else:
-            return "Function not triggered based on the schedule and schedule_params."
-        
+        return self._trigger('schedule_biweekly_even', {'hour': hour, 'days': days}, *args, **kwargs)
+
     def schedule_biweekly_odd(self, hour: int, days: List[int], *args: List[Any], **kwargs: Dict[Any, Any]) -> None:
-        now = datetime.datetime.now()
-        if now.weekday() in days and now.hour == hour and (now.isocalendar()[1] % 2) != 0:
-            self.function_to_execute(*args, **kwargs)
-            return "Function scheduled and triggered successfully."
-        else:
-            return "Function not triggered based on the schedule and schedule_params."
-        
+        return self._trigger('schedule_biweekly_odd', {'hour': hour, 'days': days}, *args, **kwargs)
+
     def schedule_first_and_third_week(self, hour: int, days: List[int], *args: List[Any], **kwargs: Dict[Any, Any]) -> None:
-        now = datetime.datetime.now()
-        week_number = (now.day - 1) // 7 + 1
-        if now.weekday() in days and now.hour == hour and week_number in [1, 3]:
-            self.function_to_execute(*args, **kwargs)
-            return "Function scheduled and triggered successfully."
-        else:
-            return "Function not triggered based on the schedule and schedule_params."
-        
+        return self._trigger('schedule_first_and_third_week', {'hour': hour, 'days': days}, *args, **kwargs)
+
     def schedule_monthly(self, hour: int, day: int, *args: List[Any], **kwargs: Dict[Any, Any]) -> None:
-        now = datetime.datetime.now()
-        if now.day == day and now.hour == hour:
-            self.function_to_execute(*args, **kwargs)
-            return "Function scheduled and triggered successfully."
-        else:
-            return "Function not triggered based on the schedule and schedule_params."
-        
+        return self._trigger('schedule_monthly', {'hour': hour, 'day': day}, *args, **kwargs)
+
     def schedule_first_business_day(self, hour: int, *args: List[Any], **kwargs: Dict[Any, Any]) -> None:
-        now = datetime.datetime.now()
-        if now.weekday() < 5:
-            if now.day == 1:
-                self.function_to_execute(*args, **kwargs)
-                next_day = now + datetime.timedelta(days=1)
-                while next_day.weekday() >= 5:
-                    next_day += datetime.timedelta(days=1)
-                return "Function scheduled and triggered successfully."
-        else:
-            next_day = now + datetime.timedelta(days=1)
-            while next_day.weekday() >= 5:
-                next_day += datetime.timedelta(days=1)
-            return "Function not triggered based on the schedule and schedule_params."
+        return self._trigger('schedule_first_business_day', {'hour': hour}, *args, **kwargs)
+
     def schedule_second_business_day(self, hour: int, *args: List[Any], **kwargs: Dict[Any, Any]) -> None:
-        now = datetime.datetime.now()
-        if now.weekday() < 5:
-            if now.day == 2:
-                self.function_to_execute(*args, **kwargs)
-                next_day = now + datetime.timedelta(days=1)
-                while next_day.weekday() >= 5:
-                    next_day += datetime.timedelta(days=1)
-                return "Function scheduled and triggered successfully."
-        else:
-            next_day = now + datetime.timedelta(days=1)
-            while next_day.weekday() >= 5:
-                next_day += datetime.timedelta(days=1)
-            return "Function not triggered based on the schedule and schedule_params."
+        return self._trigger('schedule_second_business_day', {'hour': hour}, *args, **kwargs)
+
     def schedule_first_and_fifteenth(self, hour: int, *args: List[Any], **kwargs: Dict[Any, Any]) -> None:
-        now = datetime.datetime.now()
-        if now.hour == hour and (now.day ==  1 or now.day == 15):
+        return self._trigger('schedule_first_and_fifteenth', {'hour': hour}, *args, **kwargs)
+
+    def rule(self, schedule_method: str, schedule_params: Dict[str, Any]) -> CalendarRule:
+        return rule_for(schedule_method, schedule_params, self.calendar)
+
+    def next_fire_time(self, schedule_method: str, schedule_params: Dict[str, Any],
+                       after: datetime.datetime = None) -> datetime.datetime:
+        return self.rule(schedule_method, schedule_params).next_after(after or datetime.datetime.now())
+
+    def last_fire_time(self, schedule_method: str, schedule_params: Dict[str, Any],
+                       at: datetime.datetime = None) -> datetime.datetime:
+        return self.rule(schedule_method, schedule_params).last_at_or_before(at or datetime.datetime.now())
+
+    def _trigger(self, schedule_method, schedule_params, *args, **kwargs):
+        # Runs are launched hourly, so a schedule is due when it fires within the current hour
+        if self.rule(schedule_method, schedule_params).fires_within(datetime.datetime.now()):
             self.function_to_execute(*args, **kwargs)
             return "Function scheduled and triggered successfully."
         else:
             return "Function not triggered based on the schedule and schedule_params."
 
+class DagJob:
+    def __init__(self, name, func, args=(), kwargs=None, depends_on=(), pass_results=False):
+        self.name = name
+        self.func = func
+        self.args = tuple(args)
+        self.kwargs = dict(kwargs or {})
+        self.depends_on = [depends_on] if isinstance(depends_on, str) else list(depends_on)
+        # When set, upstream results are passed in as upstream={name: result}
+        self.pass_results = pass_results
+
+class DagResult:
+    def __init__(self):
+        self.results = {}
+        self.errors = {}
+        self.cancelled = []
+        self.timings = {}
+        self.critical_path = []
+        self.critical_path_seconds = 0.0
+        self.wall_seconds = 0.0
+
+    @property
+    def ok(self):
+        return not self.errors and not self.cancelled
+
+    def summary(self):
+        return {"succeeded": len(self.results), "failed": len(self.errors), "cancelled": len(self.cancelled),
+                "wall_seconds": round(self.wall_seconds, 3),
+                "critical_path": self.critical_path,
+                "critical_path_seconds": round(self.critical_path_seconds, 3)}
+
+class DagExecutionError(Exception):
+    def __init__(self, result):
+        self.result = result
+        failed = ", ".join([f"{name}: {error!r}" for name, error in result.errors.items()])
+        super().__init__(f"{len(result.errors)} job(s) failed ({failed}); "
+                         f"{len(result.cancelled)} downstream job(s) cancelled")
+
+class ParallelJob:
+    def __init__(self, func, args=(), kwargs=None, backend=None, timeout=None, retries=None, backoff=None,
+                 resource=None):
+        self.func = func
+        self.args = tuple(args)
+        self.kwargs = dict(kwargs or {})
+        # thread, process or asyncio; None uses run_parallel's default (coroutines always use asyncio).
+        # timeout, retries and backoff also fall back to run_parallel's when left as None
+        self.backend = backend
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        # Jobs sharing a resource class (e.g. "db", "smtp") are limited by resource_limits
+        self.resource = resource
+
+class _SharedFrame:
+    # A DataFrame handed back from a worker process: fixed-width numpy columns travel
+    # through shared memory blocks, anything else (strings, categoricals, ...) is pickled
+    def __init__(self, index, columns, blocks, pickled):
+        self.index = index
+        self.columns = columns
+        self.blocks = blocks
+        self.pickled = pickled
+
+    @staticmethod
+    def export(df):
+        blocks = []
+        pickled = {}
+        for position in range(df.shape[1]):
+            dtype = df.dtypes.iloc[position]
+            if not isinstance(dtype, np.dtype) or dtype.kind not in 'biufcmM':
+                pickled[position] = df.iloc[:, position].reset_index(drop=True)
+                continue
+            values = df.iloc[:, position].to_numpy()
+            block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+            np.ndarray(values.shape, values.dtype, buffer=block.buf)[:] = values
+            blocks.append((position, block.name, values.dtype.str, values.shape))
+            block.close()
+            # The parent process unlinks the block once it has copied it
+            resource_tracker.unregister(block._name, "shared_memory")
+        return _SharedFrame(df.index, list(df.columns), blocks, pickled)
+
+    def restore(self):
+        series = dict(self.pickled)
+        for position, name, dtype, shape in self.blocks:
+            block = shared_memory.SharedMemory(name=name)
+            try:
+                series[position] = pd.Series(np.ndarray(shape, np.dtype(dtype), buffer=block.buf).copy())
+            finally:
+                block.close()
+                block.unlink()
+        if not series:
+            return pd.DataFrame(index=self.index, columns=self.columns)
+        df = pd.concat([series[position] for position in range(len(self.columns))], axis=1)
+        df.columns = self.columns
+        df.index = self.index
+        return df
+
+    def discard(self):
+        for _, name, _, _ in self.blocks:
+            try:
+                block = shared_memory.SharedMemory(name=name)
+                block.close()
+                block.unlink()
+            except FileNotFoundError:
+                pass
+
+def _run_in_process(func, args, kwargs):
+    # Module level so it can be pickled into worker processes
+    result = func(*args, **kwargs)
+    # Windows frees a shared memory block as soon as its creator closes it, so only
+    # POSIX systems can hand frames back this way
+    # A function that returns a frame has imported pandas already; checking sys.modules keeps
+    # workers of jobs that never touch pandas from importing it
+    pandas = sys.modules.get("pandas")
+    if pandas is not None and isinstance(result, pandas.DataFrame) and os.name != 'nt':
+        return _SharedFrame.export(result)
+    return result
+
+
+class _ExecutorBackends:
+    def __init__(self, pool_size):
+        self.pool_size = pool_size
+        self._lock = threading.Lock()
+        self._threads = None
+        self._processes = None
+        self._loop = None
+        self._loop_thread = None
+
+    def submit(self, backend, func, args, kwargs):
+        if backend == "thread":
+            return self._thread_executor().submit(func, *args, **kwargs)
+        if backend == "process":
+            return self._process_executor().submit(_run_in_process, func, args, kwargs)
+        if backend == "asyncio":
+            if not inspect.iscoroutinefunction(func):
+                raise ValueError(f"{getattr(func, '__name__', func)} is not a coroutine function")
+            return asyncio.run_coroutine_threadsafe(func(*args, **kwargs), self._event_loop())
+        raise ValueError(f"Unknown backend: {backend}. Use thread, process or asyncio.")
+
+    def shutdown(self):
+        # Only attempts abandoned after a timeout can still be running here; don't wait for them
+        if self._threads is not None:
+            self._threads.shutdown(wait=False)
+        if self._processes is not None:
+            self._processes.shutdown(wait=False)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop_thread.join()
+            self._loop.close()
+
+    def _thread_executor(self):
+        with self._lock:
+            if self._threads is None:
+                self._threads = concurrent.futures.ThreadPoolExecutor(max_workers=self.pool_size)
+            return self._threads
+
+    def _process_executor(self):
+        with self._lock:
+            if self._processes is None:
+                self._processes = concurrent.futures.ProcessPoolExecutor(max_workers=self.pool_size)
+            return self._processes
+
+    def _event_loop(self):
+        # One event loop on its own thread serves every asyncio job of the run
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._loop_thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+                self._loop_thread.start()
+            return self._loop
+
 class ParallelRunner:
     @staticmethod
-    def run_parallel(func_list, pool_size=10):
-        def worker(func_args):
-            func, args = func_args
-            func(*args)
+    def run_parallel(func_list, pool_size=10, backend="thread", timeout=None, retries=0, backoff=1.0,
+                     resource_limits=None, return_futures=False, return_exceptions=False):
+        # func_list holds (func, args) pairs and/or ParallelJob objects; job settings win over
+        # the run-wide defaults
+        jobs = []
+        for entry in func_list:
+            if not isinstance(entry, ParallelJob):
+                func, args = entry
+                entry = ParallelJob(func, args)
+            jobs.append(entry)
+        backends = _ExecutorBackends(pool_size)
+        # Jobs waiting for a resource slot sit in that resource's queue rather than blocking a
+        # thread, so a burst of throttled jobs does not hold up everything else
+        free = dict(resource_limits or {})
+        queued = {resource: deque() for resource in free}
+        lock = threading.Lock()
+
+        def start(job, result, attempt):
+            if job.resource in free:
+                with lock:
+                    if free[job.resource] <= 0:
+                        queued[job.resource].append((job, result, attempt))
+                        return
+                    free[job.resource] -= 1
+            launch(job, result, attempt)
+
+        def release(resource):
+            # Hand the slot straight to the next queued attempt, if any
+            if resource not in free:
+                return
+            with lock:
+                if not queued[resource]:
+                    free[resource] += 1
+                    return
+                job, result, attempt = queued[resource].popleft()
+            launch(job, result, attempt)
+
+        def launch(job, result, attempt):
+            job_backend = "asyncio" if inspect.iscoroutinefunction(job.func) else (job.backend or backend)
+            job_timeout = job.timeout if job.timeout is not None else timeout
+            # Whichever of completion and timeout comes first settles the attempt; the check
+            # and the set happen under one lock, so a job finishing right at its timeout is
+            # neither retried after succeeding nor settled twice
+            settled = False
+            settle_lock = threading.Lock()
+            timer = None
+            try:
+                future = backends.submit(job_backend, job.func, job.args, job.kwargs)
+            except Exception as e:
+                release(job.resource)
+                retry_or_fail(job, result, attempt, e)
+                return
+
+            def settle():
+                nonlocal settled
+                with settle_lock:
+                    if settled:
+                        return False
+                    settled = True
+                    return True
+
+            def on_timeout():
+                if not settle():
+                    return
+                # Threads cannot be killed; the attempt is abandoned but keeps its resource slot
+                # until it really finishes, and any frame it returns later is cleaned up
+                future.cancel()
+                retry_or_fail(job, result, attempt,
+                              TimeoutError(f"{getattr(job.func, '__name__', job.func)} timed out after {job_timeout}s"))
+
+            def on_done(done):
+                release(job.resource)
+                if timer is not None:
+                    timer.cancel()
+                if not settle():
+                    ParallelRunner._discard_result(done)
+                    return
+                if done.cancelled():
+                    retry_or_fail(job, result, attempt, concurrent.futures.CancelledError())
+                elif done.exception() is not None:
+                    retry_or_fail(job, result, attempt, done.exception())
+                else:
+                    value = done.result()
+                    result.set_result(value.restore() if isinstance(value, _SharedFrame) else value)
+
+            if job_timeout is not None:
+                timer = threading.Timer(job_timeout, on_timeout)
+                timer.daemon = True
+                timer.start()
+            future.add_done_callback(on_done)
+
+        def retry_or_fail(job, result, attempt, error):
+            job_retries = job.retries if job.retries is not None else retries
+            job_backoff = job.backoff if job.backoff is not None else backoff
+            if attempt >= job_retries:
+                result.set_exception(error)
+                return
+            # Exponential backoff between attempts, without holding the resource slot
+            timer = threading.Timer(job_backoff * 2 ** attempt, start, (job, result, attempt + 1))
+            timer.daemon = True
+            timer.start()
+
+        futures = []
+        for job in jobs:
+            result = concurrent.futures.Future()
+            result.set_running_or_notify_cancel()
+            futures.append(result)
+            start(job, result, 0)
+
+        def shutdown():
+            concurrent.futures.wait(futures)
+            backends.shutdown()
+
+        if return_futures:
+            # Clean up in the background once every job is done
+            threading.Thread(target=shutdown, daemon=True).start()
+            return futures
+        shutdown()
+        results = []
+        for future in futures:
+            error = future.exception()
+            if error is not None and not return_exceptions:
+                raise error
+            results.append(error if error is not None else future.result())
+        return results
+
+    @staticmethod
+    def _discard_result(future):
+        if not future.cancelled() and future.exception() is None and isinstance(future.result(), _SharedFrame):
+            future.result().discard()
+
+    @staticmethod
+    def run_dag(jobs, pool_size=10, fail_fast=False, raise_on_error=True):
+        jobs = {job.name: job for job in jobs} if not isinstance(jobs, dict) else jobs
+        order = ParallelRunner._topological_order(jobs)
+        downstream = {name: [] for name in jobs}
+        for job in jobs.values():
+            for dependency in job.depends_on:
+                downstream[dependency].append(job.name)
+        waiting_on = {name: set(job.depends_on) for name, job in jobs.items()}
+        result = DagResult()
+        condition = threading.Condition()
+        pending = set(jobs)
+        running = set()
+        started = time.perf_counter()
         pool = Pool(pool_size)
-        for func, args in func_list:
-            pool.apply_async(worker, ((func, args),))
-        pool.close()
-        pool.join()
+
+        def submit(name):
+            job = jobs[name]
+            kwargs = dict(job.kwargs)
+            if job.pass_results:
+                kwargs['upstream'] = {dependency: result.results[dependency] for dependency in job.depends_on}
+            result.timings[name] = {"start": time.perf_counter() - started}
+            pool.apply_async(job.func, job.args, kwargs,
+                             callback=lambda value: finished(name, value, None),
+                             error_callback=lambda error: finished(name, None, error))
+
+        def cancel(name):
+            # Everything downstream of a failure is skipped
+            for child in downstream[name]:
+                if child in pending and child not in result.cancelled:
+                    result.cancelled.append(child)
+                    pending.discard(child)
+                    cancel(child)
+
+        def finished(name, value, error):
+            with condition:
+                timing = result.timings[name]
+                timing["end"] = time.perf_counter() - started
+                timing["seconds"] = timing["end"] - timing["start"]
+                pending.discard(name)
+                if error is not None:
+                    result.errors[name] = error
+                    cancel(name)
+                    if fail_fast:
+                        for other in [other for other in order if other in pending and other not in running]:
+                            result.cancelled.append(other)
+                            pending.discard(other)
+                else:
+                    result.results[name] = value
+                    for child in downstream[name]:
+                        waiting_on[child].discard(name)
+                        if not waiting_on[child] and child in pending and child not in running:
+                            running.add(child)
+                            submit(child)
+                running.discard(name)
+                condition.notify_all()
+
+        try:
+            with condition:
+                # Independent roots start straight away; everything else starts when its inputs finish
+                for name in order:
+                    if not waiting_on[name]:
+                        running.add(name)
+                        submit(name)
+                while pending:
+                    condition.wait()
+        finally:
+            pool.close()
+            pool.join()
+        result.wall_seconds = time.perf_counter() - started
+        result.critical_path, result.critical_path_seconds = ParallelRunner._critical_path(jobs, result.timings)
+        if result.errors and raise_on_error:
+            raise DagExecutionError(result)
+        return result
+
+    @staticmethod
+    def _topological_order(jobs):
+        for job in jobs.values():
+            unknown = [dependency for dependency in job.depends_on if dependency not in jobs]
+            if unknown:
+                raise ValueError(f"Job {job.name} depends on unknown job(s): {unknown}")
+        remaining = {name: len(job.depends_on) for name, job in jobs.items()}
+        ready = [name for name, count in remaining.items() if count == 0]
+        order = []
+        while ready:
+            name = ready.pop(0)
+            order.append(name)
+            for job in jobs.values():
+                if name in job.depends_on:
+                    remaining[job.name] -= 1
+                    if remaining[job.name] == 0:
+                        ready.append(job.name)
+        if len(order) != len(jobs):
+            raise ValueError(f"Job dependencies form a cycle: {sorted(set(jobs) - set(order))}")
+        return order
+
+    @staticmethod
+    def _critical_path(jobs, timings):
+        # Walk back from the job that finished last, always through the input that finished last
+        finished = {name: timing for name, timing in timings.items() if "end" in timing}
+        if not finished:
+            return [], 0.0
+        name = max(finished, key=lambda item: finished[item]["end"])
+        path = [name]
+        while True:
+            inputs = [dependency for dependency in jobs[name].depends_on if dependency in finished]
+            if not inputs:
+                break
+            name = max(inputs, key=lambda item: finished[item]["end"])
+            path.append(name)
+        path.reverse()
+        return path, sum([finished[name]["seconds"] for name in path])
 
 class ScheduledFunctionExecutor:
-    def __init__(self, function, schedule_method, schedule_params, arguments, source):
-        self.scheduler = Scheduler(function)
+    def __init__(self, function, schedule_method, schedule_params, arguments, source, calendar=None):
+        self.scheduler = Scheduler(function, calendar)
         self.function_name = function.__name__
         self.schedule_method = schedule_method
         self.schedule_params = schedule_params
         self.arguments = arguments
         self.source = source
 
+    def execute(self):
+        now = datetime.datetime.now()
+        slot = self.slot(now)
+        due = slot is not None and slot >= now.replace(minute=0, second=0, microsecond=0)
+        # Keyed by the schedule slot, so a rerun in a later hour finds the slot's checkpoints
+        job_key = slot_key(self.source, slot) if slot is not None else None
+        # A slot a previous run left failed or unfinished is run again even when it is not this hour's
+        if not due and (job_key is None or not journal.needs_rerun(job_key)):
+            return "Function not triggered based on the schedule and schedule_params."
+        if journal.is_complete(job_key):
+            return "Function already completed for this schedule window, skipped."
+        # Only runs that actually fire get a span, so skipped hours do not drag the baseline down
+        with telemetry.span(f"job:{self.source}", function=self.function_name,
+                            schedule_method=self.schedule_method, scheduled_for=slot.isoformat()), \
+                journal.job(job_key, self.source):
+            self.scheduler.function_to_execute(**self.arguments)
+        return "Function scheduled and triggered successfully."
+
+    def slot(self, now=None):
+        # The fire time a run launched at now belongs to: the one in the current hour, as runs
+        # are launched hourly, otherwise the last one before now
+        now = now or datetime.datetime.now()
+        hour = now.replace(minute=0, second=0, microsecond=0)
+        upcoming = self.scheduler.next_fire_time(self.schedule_method, self.schedule_params,
+                                                 hour - datetime.timedelta(minutes=1))
+        if upcoming is not None and upcoming < hour + datetime.timedelta(hours=1):
+            return upcoming
+        return self.scheduler.last_fire_time(self.schedule_method, self.schedule_params, now)
+
+class SchedulerDaemon:
+    def __init__(self, scheduled_functions, max_workers=4, jitter=0, catch_up=True,
+                 misfire_grace=3600, logger=None, state_file=None):
+        self.max_workers = max_workers
+        self.jitter = jitter
+        self.catch_up = catch_up
+        self.misfire_grace = misfire_grace
+        self.logger = logger or logging.getLogger("ExecutionLog")
+        # JSON file with each job's last fire time, so a run missed while the daemon was
+        # down is made up when it starts again (subject to catch_up and misfire_grace)
+        self.state_file = state_file
+        self._last_fired = self._load_state()
+        # Heap of (fire_at, sequence, job_id, scheduled_for); fire_at includes jitter
+        self._heap = []
+        self._jobs = {}
+        self._running = set()
+        self._sequence = 0
+        self._stopping = False
+        self._condition = threading.Condition()
+        self._executor = None
+        for scheduled_function in scheduled_functions:
+            self.add_job(scheduled_function)
+
+    def add_job(self, scheduled_function, now=None):
+        with self._condition:
+            job_id = len(self._jobs)
+            self._jobs[job_id] = scheduled_function
+            self._schedule_first(job_id, now or datetime.datetime.now())
+            # Wake the loop in case the new job is due before everything else
+            self._condition.notify()
+        return job_id
+
+    def upcoming(self):
+        with self._condition:
+            return [(fire_at, self._jobs[job_id].source, self._jobs[job_id].function_name)
+                    for fire_at, _, job_id, _ in sorted(self._heap)]
+
+    def run_forever(self, install_signal_handlers=True):
+        if install_signal_handlers and threading.current_thread() is threading.main_thread():
+            for signal_name in ("SIGINT", "SIGTERM"):
+                if hasattr(signal, signal_name):
+                    signal.signal(getattr(signal, signal_name), lambda signum, frame: self.stop(wait=False))
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        self.logger.info(f"Scheduler started with {len(self._jobs)} jobs")
+        try:
+            with self._condition:
+                while not self._stopping:
+                    if not self._heap:
+                        self._condition.wait()
+                        continue
+                    fire_at, _, job_id, scheduled_for = self._heap[0]
+                    now = datetime.datetime.now()
+                    delay = (fire_at - now).total_seconds()
+                    if delay > 0:
+                        # Sleep until the earliest deadline; re-check at least hourly in case
+                        # the wall clock jumped (DST, suspend)
+                        self._condition.wait(min(delay, 3600))
+                        continue
+                    heapq.heappop(self._heap)
+                    self._fire(job_id, scheduled_for, now)
+                    self._schedule(job_id, max(scheduled_for, now))
+        finally:
+            self.logger.info("Scheduler stopping, waiting for running jobs to finish")
+            self._executor.shutdown(wait=True)
+            self.logger.info("Scheduler stopped")
+
+    def stop(self, wait=True):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if wait and self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    def _schedule_first(self, job_id, now):
+        job = self._jobs[job_id]
+        latest = job.scheduler.last_fire_time(job.schedule_method, job.schedule_params, now)
+        if latest is not None and self._missed(job, latest):
+            # Several missed runs are made up by one run of the latest
+            self._push(job_id, latest)
+        else:
+            self._schedule(job_id, now)
+
+    def _missed(self, job, latest):
+        last_fired = self._last_fired.get(job.source)
+        if last_fired is not None and last_fired < latest:
+            self.logger.warning(f"{job.source}; {job.function_name} last fired at {last_fired}, "
+                                f"missed the run scheduled for {latest}")
+            return True
+        # A run that failed or died with the previous process resumes from its checkpoints
+        if journal.needs_rerun(slot_key(job.source, latest)):
+            self.logger.warning(f"{job.source}; {job.function_name} did not finish the run scheduled for "
+                                f"{latest}, running it again")
+            return True
+        return False
+
+    def _schedule(self, job_id, after):
+        job = self._jobs[job_id]
+        scheduled_for = job.scheduler.next_fire_time(job.schedule_method, job.schedule_params, after)
+        if scheduled_for is None:
+            self.logger.error(f"Schedule never fires, dropping: {job.source}; {job.function_name}; "
+                              f"{job.schedule_method}; {job.schedule_params}")
+            return
+        self._push(job_id, scheduled_for)
+
+    def _push(self, job_id, scheduled_for):
+        fire_at = scheduled_for
+        if self.jitter:
+            fire_at += datetime.timedelta(seconds=random.uniform(0, self.jitter))
+        self._sequence += 1
+        heapq.heappush(self._heap, (fire_at, self._sequence, job_id, scheduled_for))
+
+    def _fire(self, job_id, scheduled_for, now):
+        job = self._jobs[job_id]
+        # Recorded whether the run goes ahead or is skipped below, either way the slot is dealt with
+        self._last_fired[job.source] = scheduled_for
+        self._save_state()
+        late = (now - scheduled_for).total_seconds()
+        if late > self.misfire_grace + self.jitter and not self.catch_up:
+            self.logger.warning(f"Skipping missed run of {job.source}; {job.function_name} "
+                                f"scheduled for {scheduled_for}")
+            return
+        if job_id in self._running:
+            self.logger.warning(f"Skipping {job.source}; {job.function_name} for {scheduled_for}, "
+                                f"the previous run is still going")
+            return
+        self._running.add(job_id)
+        self._executor.submit(self._run, job_id, scheduled_for)
+
+    def _load_state(self):
+        if self.state_file is None or not os.path.exists(self.state_file):
+            return {}
+        try:
+            with open(self.state_file, 'r') as f:
+                return {source: datetime.datetime.fromisoformat(fired) for source, fired in json.load(f).items()}
+        except (ValueError, OSError) as e:
+            self.logger.warning(f"Ignoring unreadable scheduler state {self.state_file}: {e}")
+            return {}
+
+    def _save_state(self):
+        if self.state_file is None:
+            return
+        partial = f"{self.state_file}.tmp"
+        with open(partial, 'w') as f:
+            json.dump({source: fired.isoformat() for source, fired in self._last_fired.items()}, f, indent=2)
+        os.replace(partial, self.state_file)
+
+    def _run(self, job_id, scheduled_for):
+        job = self._jobs[job_id]
+        start = time.perf_counter()
+        try:
+            self.logger.info(
+                f"Executing package/function:\t{job.source}; {job.function_name}; {job.schedule_method}; {job.schedule_params}")
+            job_key = slot_key(job.source, scheduled_for)
+            if journal.is_complete(job_key):
+                self.logger.info(f"Skipping {job.source}; {job.function_name}, already completed for {scheduled_for}")
+                return
+            with telemetry.span(f"job:{job.source}", function=job.function_name,
+                                schedule_method=job.schedule_method, scheduled_for=scheduled_for.isoformat()), \
+                    journal.job(job_key, job.source):
+                job.scheduler.function_to_execute(**job.arguments)
+            self.logger.info(f"Finished {job.source}; {job.function_name} in {time.perf_counter() - start:.1f}s")
+        except Exception as e:
+            self.logger.error(
+                f"Error executing function: {job.source} -> {job.function_name}\t {e}")
+        finally:
+            with self._condition:
+                self._running.discard(job_id)
+            # The daemon never ends, so hand each job's spans to the exporters as it finishes
+            telemetry.flush()
+
@@ -1,14 +1,167 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+# scrypt cost parameters; raise SCRYPT_N as hardware gets faster
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+HASH_PREFIX = "scrypt$"
+
+
+def hash_password(password, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P, salt=None):
+    # Stored as scrypt$n$r$p$salt$hash so the cost can change without breaking old entries
+    salt = salt or secrets.token_bytes(16)
+    digest = _scrypt(password, salt, n, r, p)
+    return HASH_PREFIX + "$".join([str(n), str(r), str(p),
+                                   base64.b64encode(salt).decode(), base64.b64encode(digest).decode()])
+
+
+def verify_password(password, stored):
+    if not stored.startswith(HASH_PREFIX):
+        # Entries that were never hashed are still compared in constant time
+        return hmac.compare_digest(password.encode(), stored.encode())
+    n, r, p, salt, digest = stored[len(HASH_PREFIX):].split("$")
+    expected = base64.b64decode(digest)
+    return hmac.compare_digest(_scrypt(password, base64.b64decode(salt), int(n), int(r), int(p)), expected)
+
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + 1024 * 1024, dklen=32)
+
+
+class CredentialStore:
+    # Loads the properties file once and reloads it only when it changes on disk
+    def __init__(self, properties_file_path, session_ttl=300, max_sessions=1024):
+        self.properties_file_path = properties_file_path
+        # Seconds a successful login is remembered, so repeated logins skip the hashing
+        self.session_ttl = session_ttl
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._signature = None
+        self._credentials = {}
+        # Sessions are keyed by a keyed digest of the password, never the password itself
+        self._session_key = secrets.token_bytes(32)
+        self._sessions = OrderedDict()
+
+    def verify(self, username, password):
+        with self._lock:
+            self._reload_if_changed()
+            stored = self._credentials.get(username)
+            session = (username, hmac.new(self._session_key, password.encode(), hashlib.sha256).digest())
+            expires = self._sessions.get(session)
+            if stored is not None and expires is not None and expires > time.monotonic():
+                self._sessions.move_to_end(session)
+                return True
+        if stored is None:
+            # Hash anyway so unknown users take as long as known ones
+            _scrypt(password, secrets.token_bytes(16), SCRYPT_N, SCRYPT_R, SCRYPT_P)
+            return False
+        verified = verify_password(password, stored)
+        if verified and self.session_ttl:
+            with self._lock:
+                self._sessions[session] = time.monotonic() + self.session_ttl
+                self._sessions.move_to_end(session)
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+        return verified
+
+    def set_password(self, username, password):
+        # Adds or replaces a user in the file with a hashed password
+        with self._lock:
+            self._reload_if_changed()
+            self._credentials[username] = hash_password(password)
+            self._write()
+
+    def hash_plaintext_passwords(self):
+        # Rewrites entries that still hold plaintext passwords as hashes; returns how many changed
+        with self._lock:
+            self._reload_if_changed()
+            plaintext = [username for username, stored in self._credentials.items() if not stored.startswith(HASH_PREFIX)]
+            for username in plaintext:
+                self._credentials[username] = hash_password(self._credentials[username])
+            if plaintext:
+                self._write()
+            return len(plaintext)
+
+    def users(self):
+        with self._lock:
+            self._reload_if_changed()
+            return list(self._credentials)
+
+    def _reload_if_changed(self):
+        stat = os.stat(self.properties_file_path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature == self._signature:
+            return
+        self._credentials = read_properties_file(self.properties_file_path)
+        # A changed or removed password must not keep working through an old session
+        self._sessions.clear()
+        self._signature = signature
+
+    def _write(self):
+        # Only the values that changed are replaced, so comments, blank lines and the order of
+        # the file survive; new users are appended
+        with open(self.properties_file_path, 'r') as f:
+            lines = f.readlines()
+        present = set()
+        for position, line in enumerate(lines):
+            stripped = line.strip()
+            if not stripped or stripped.startswith('#'):
+                continue
+            key, _, value = stripped.partition('=')
+            key = key.strip()
+            present.add(key)
+            stored = self._credentials.get(key)
+            if stored is None or stored == value.strip():
+                continue
+            content = line.rstrip('\n')
+            if '=' in content:
+                # Keep the key and any spacing around the '=' as they were
+                value_at = content.index('=') + 1
+                head = content[:value_at + len(content[value_at:]) - len(content[value_at:].lstrip())]
+            else:
+                head = content + '='
+            lines[position] = f"{head}{stored}\n"
+        if lines and not lines[-1].endswith('\n'):
+            lines[-1] += '\n'
+        lines.extend(f"{username}={stored}\n" for username, stored in self._credentials.items()
+                     if username not in present)
+        partial = f"{self.properties_file_path}.{os.getpid()}.tmp"
+        with open(partial, 'w') as f:
+            f.writelines(lines)
+        os.replace(partial, self.properties_file_path)
+        self._signature = None
+        self._reload_if_changed()
+
+
+def read_properties_file(properties_file_path):
+    # Read the properties file and return a dictionary of key-value pairs
+    auth_data = {}
+    with open(properties_file_path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                # Only the first '=' separates the key, values may contain more of them
+                key, _, value = line.partition('=')
+                auth_data[key.strip()] = value.strip()
+    return auth_data
+
+
 class AuthenticationManager:
-    def __init__(self, properties_file_path):
+    def __init__(self, properties_file_path, session_ttl=300):
         self.authenticated = False
         self.properties_file_path = properties_file_path
-    
-    def authenticate(self, username, password):
-        # Read the properties file for authentication data
-        auth_data = self._read_properties_file()
+        self.store = CredentialStore(properties_file_path, session_ttl=session_ttl)
 
-        # Check if the provided username and password match the authentication data
-        if auth_data.get(username) == password:
+    def authenticate(self, username, password):
+        # Check the provided username and password against the in-memory credential index
+        if self.store.verify(username, password):
             self.authenticated = True
             return True
         else:
@@ -16,14 +169,6 @@ class AuthenticationManager:
 
     def is_authenticated(self):
         return self.authenticated
-    
+
     def _read_properties_file(self):
-        # Read the properties file and return a dictionary of key-value pairs
-        auth_data = {}
-        with open(self.properties_file_path, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#'):
-                    key, value = line.split('=')
-                    auth_data[key.strip()] = value.strip()
-        return auth_data
+        return read_properties_file(self.properties_file_path)
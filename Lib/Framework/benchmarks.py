@@ -0,0 +1,493 @@
+# Benchmarks for the framework's hot paths, run against local stand-ins so they need
+# no database, mail server or network:
+#
+#   cd Lib
+#   python -m Framework.benchmarks run --rows 10000 100000 1000000 --output bench.json
+#   python -m Framework.benchmarks compare baseline.json bench.json --threshold 1.2
+#
+# SQL benchmarks use an in-memory pyodbc-compatible fake, so they measure the time the
+# framework itself spends building statements, binding rows and building DataFrames,
+# not the time a real server would take.
+import argparse
+import contextlib
+import datetime
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import re
+import shutil
+import socketserver
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from . import AutoApi
+
+GROUPS = ("sql", "file", "config", "email")
+FILE_FORMATS = ("csv", "txt", "xlsx", "json", "xml", "dbf")
+# Formats that cannot hold more rows than this
+FORMAT_MAX_ROWS = {"xlsx": 1048575}
+
+
+def synthetic_frame(rows, seed=0):
+    # Same seed, same data, so runs on different days are comparable
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "id": np.arange(1, rows + 1, dtype="int64"),
+        "name": np.char.add("customer_", rng.integers(0, 10 ** 6, rows).astype(str)).astype(object),
+        "amount": rng.normal(1000, 250, rows).round(2),
+        "created": pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, 3 * 365, rows), unit="D"),
+        "flag": rng.random(rows) < 0.5,
+    })
+
+
+def synthetic_config(values, environments=10):
+    # Nested config shaped like the real ones: {environment: {setting: value}}
+    per_environment = max(1, values // environments)
+    return {f"env_{env}": {f"setting_{key}": f"value-{env}-{key}-{'x' * 24}" for key in range(per_environment)}
+            for env in range(environments)}
+
+
+def write_file(frame, path, file_format):
+    if file_format == "csv":
+        frame.to_csv(path, index=False)
+    elif file_format == "txt":
+        frame.to_csv(path, sep="\t", index=False)
+    elif file_format == "xlsx":
+        frame.to_excel(path, sheet_name="Sheet1", index=False)
+    elif file_format == "json":
+        frame.to_json(path, date_format="iso")
+    elif file_format == "xml":
+        frame.to_xml(path, index=False)
+    elif file_format == "dbf":
+        write_dbf(frame, path)
+    else:
+        raise ValueError(f"Unsupported file type: {file_format}")
+
+
+def write_dbf(frame, path):
+    # dBase III table with the synthetic frame's columns
+    fields = [(b"ID", b"N", 11, 0), (b"NAME", b"C", 20, 0), (b"AMOUNT", b"N", 15, 2),
+              (b"CREATED", b"D", 8, 0), (b"FLAG", b"L", 1, 0)]
+    header_length = 32 + 32 * len(fields) + 1
+    record_length = 1 + sum(field[2] for field in fields)
+    today = datetime.date.today()
+    with open(path, "wb") as f:
+        f.write(struct.pack("<BBBBIHH20x", 3, today.year - 1900, today.month, today.day,
+                            len(frame), header_length, record_length))
+        for name, field_type, length, decimals in fields:
+            f.write(struct.pack("<11sc4xBB14x", name, field_type, length, decimals))
+        f.write(b"\r")
+        created = frame["created"].dt.strftime("%Y%m%d")
+        for record in zip(frame["id"], frame["name"], frame["amount"], created, frame["flag"]):
+            f.write(b" " + str(record[0]).rjust(11).encode() + record[1][:20].ljust(20).encode()
+                    + f"{record[2]:15.2f}".encode() + record[3].encode() + (b"T" if record[4] else b"F"))
+        f.write(b"\x1a")
+
+
+class FakeSqlServer:
+    # Keeps tables in memory and answers the statements SqlOperations sends
+    SQL_TYPES = {"i": "bigint", "f": "float", "b": "bit", "M": "datetime2", "O": "nvarchar"}
+    PYTHON_TYPES = {"i": int, "f": float, "b": bool, "M": datetime.datetime, "O": str}
+
+    def __init__(self):
+        self.tables = {}
+        self.rows_written = 0
+
+    def create_table(self, table_name, frame, key_columns=("id",)):
+        self.tables[self._name(table_name)] = {
+            "columns": [str(column) for column in frame.columns],
+            "kinds": [frame[column].dtype.kind if frame[column].dtype.kind in self.SQL_TYPES else "O"
+                      for column in frame.columns],
+            "keys": list(key_columns),
+            "rows": list(frame.astype(object).itertuples(index=False, name=None)),
+        }
+
+    def connect(self, connection_string=None, **kwargs):
+        return FakeConnection(self)
+
+    def table(self, table_name):
+        return self.tables.get(self._name(table_name))
+
+    @staticmethod
+    def _name(table_name):
+        return table_name.split(".")[-1].strip('[]"').lower()
+
+
+class FakeConnection:
+    def __init__(self, server):
+        self.server = server
+
+    def cursor(self):
+        return FakeCursor(self.server)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeCursor:
+    def __init__(self, server):
+        self.server = server
+        self.fast_executemany = False
+        self.description = None
+        self.rowcount = -1
+        self._rows = []
+        self._position = 0
+        self._staged = 0
+
+    def execute(self, sql, *params):
+        text = " ".join(sql.split()).lower()
+        self._rows, self._position, self.description = [], 0, None
+        if "information_schema.columns" in text:
+            table = self.server.table(params[1])
+            if table:
+                self._result([("COLUMN_NAME", str), ("DATA_TYPE", str), ("IS_NULLABLE", str)],
+                             [(column, FakeSqlServer.SQL_TYPES[kind], "YES")
+                              for column, kind in zip(table["columns"], table["kinds"])])
+        elif "information_schema.key_column_usage" in text:
+            table = self.server.table(params[1])
+            self._result([("COLUMN_NAME", str)], [(key,) for key in (table["keys"] if table else [])])
+        elif text.startswith("select merge_action"):
+            self._result([("merge_action", str), ("count", int)], [("UPDATE", self._staged)])
+        elif text.startswith("select"):
+            match = re.search(r"\bfrom\s+([\w.\[\]#]+)", text)
+            table = self.server.table(match.group(1)) if match else None
+            if table is None:
+                self._result([("value", int)], [(1,)])
+            else:
+                rows = [] if text.startswith("select top 0") else table["rows"]
+                self._result([(column, FakeSqlServer.PYTHON_TYPES[kind])
+                              for column, kind in zip(table["columns"], table["kinds"])], rows)
+        return self
+
+    def executemany(self, sql, rows):
+        self.server.rows_written += len(rows)
+        if "[#" in sql:
+            self._staged += len(rows)
+
+    def fetchone(self):
+        rows = self.fetchmany(1)
+        return rows[0] if rows else None
+
+    def fetchmany(self, size=1):
+        rows = self._rows[self._position:self._position + size]
+        self._position += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._rows[self._position:]
+        self._position = len(self._rows)
+        return rows
+
+    def close(self):
+        pass
+
+    def _result(self, columns, rows):
+        self.description = [(name, python_type, None, None, None, None, True) for name, python_type in columns]
+        self._rows = rows
+        self.rowcount = len(rows)
+
+
+class _SmtpSinkHandler(socketserver.StreamRequestHandler):
+    # Accepts anything, keeps nothing
+    def handle(self):
+        self._reply("220 benchmark sink")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.strip().upper()
+            if command.startswith(b"EHLO"):
+                self._reply("250-benchmark sink", "250-8BITMIME", "250 AUTH PLAIN LOGIN")
+            elif command.startswith(b"HELO"):
+                self._reply("250 benchmark sink")
+            elif command.startswith(b"AUTH"):
+                self._reply("235 authenticated")
+            elif command == b"DATA":
+                self._reply("354 end data with <CR><LF>.<CR><LF>")
+                self._discard_data()
+                self._reply("250 queued")
+            elif command == b"QUIT":
+                self._reply("221 bye")
+                return
+            else:
+                self._reply("250 ok")
+
+    def _discard_data(self):
+        tail = b"\r\n"
+        while True:
+            chunk = self.rfile.read1(65536)
+            if not chunk:
+                return
+            window = tail + chunk
+            # The client waits for our reply, so the terminator always ends a read
+            if window.endswith(b"\r\n.\r\n"):
+                return
+            tail = window[-4:]
+
+    def _reply(self, *lines):
+        self.wfile.write("".join(f"{line}\r\n" for line in lines).encode())
+
+
+def _serve_smtp_sink(port_queue):
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _SmtpSinkHandler)
+    server.daemon_threads = True
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+@contextlib.contextmanager
+def smtp_sink():
+    # Runs in its own process so it does not compete with the sender for the GIL
+    port_queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve_smtp_sink, args=(port_queue,), daemon=True)
+    process.start()
+    try:
+        yield port_queue.get(timeout=30)
+    finally:
+        process.terminate()
+        process.join()
+
+
+def sql_benchmarks(frame, workdir):
+    server = FakeSqlServer()
+    server.create_table("dbo.benchmark", frame)
+    sql = AutoApi.SqlOperations("Benchmark Fake", "localhost", "benchmark", "user", "password",
+                                schema_cache=AutoApi.SchemaCache())
+    sql.pool = AutoApi.ConnectionPool(sql.connection_string, connect=server.connect)
+    select = "select * from dbo.benchmark"
+    yield "sql.read_data", lambda: sql.read_data(select), {}
+    yield "sql.read_data_chunks", lambda: sum(len(chunk) for chunk in sql.read_data_chunks(select)), {}
+    yield "sql.insert_data", lambda: sql.insert_data("dbo.benchmark", frame), {}
+    yield "sql.bulk_insert_data", lambda: sql.bulk_insert_data("dbo.benchmark", frame), {}
+    yield "sql.update_data", lambda: sql.update_data("dbo.benchmark", frame, "id"), {}
+    yield "sql.upsert_data", lambda: sql.upsert_data("dbo.benchmark", frame, key_columns=["id"]), {}
+
+
+def file_benchmarks(frame, workdir):
+    for file_format in FILE_FORMATS:
+        name = f"file.read.{file_format}"
+        if len(frame) > FORMAT_MAX_ROWS.get(file_format, len(frame)):
+            yield name, None, {"skipped": f"{file_format} holds at most {FORMAT_MAX_ROWS[file_format]} rows"}
+            continue
+        path = os.path.join(workdir, f"benchmark_{len(frame)}.{file_format}")
+        # Files are kept in the workdir so later runs do not pay for writing them again
+        if not os.path.exists(path):
+            write_file(frame, path, file_format)
+        yield name, lambda path=path: AutoApi.FileReader.READ(path), {"file_bytes": os.path.getsize(path)}
+    path = os.path.join(workdir, f"benchmark_{len(frame)}.csv")
+    yield ("file.read_chunks.csv",
+           lambda: sum(len(chunk) for chunk in AutoApi.FileReader.READ_CHUNKS(path)),
+           {"file_bytes": os.path.getsize(path)})
+
+
+def config_benchmarks(values, workdir):
+    data = synthetic_config(values)
+    key_path = os.path.join(workdir, "benchmark_key")
+    data_path = os.path.join(workdir, "benchmark_config")
+    config = AutoApi.ConfigProperties(config_structure="nested", file_type="json", enviroment_key="env_0")
+    yield "config.encrypt_config", lambda: config.encrypt_config(data, key_path, data_path), {}
+    config.encrypt_config(data, key_path, data_path)
+
+    def decrypt_cold():
+        # decrypt_config keeps values in a shared store; without this every run after the
+        # first would only time the cache
+        AutoApi.ConfigStore.clear_shared()
+        return config.decrypt_config(f"{key_path}.txt", f"{data_path}.json")
+
+    yield "config.decrypt_config", decrypt_cold, {}
+    yield ("config.decrypt_config_cached",
+           lambda: config.decrypt_config(f"{key_path}.txt", f"{data_path}.json"), {})
+
+
+def email_benchmarks(frame, workdir, port):
+    attachment = os.path.join(workdir, f"benchmark_{len(frame)}.csv")
+    if not os.path.exists(attachment):
+        write_file(frame, attachment, "csv")
+    options = dict(send_from="benchmark@localhost", send_to=["sink@localhost"], subject="Benchmark",
+                   message="Benchmark message", files=[attachment], server="127.0.0.1", port=port,
+                   username="benchmark", password="benchmark", use_tls=False)
+    extra = {"file_bytes": os.path.getsize(attachment)}
+    yield "email.send_mail", lambda: AutoApi.EmailSender.send_mail(**options), extra
+    yield ("email.send_mail_streaming",
+           lambda: AutoApi.EmailSender.send_mail_streaming(compress_threshold=None, **options), extra)
+
+
+def measure(func, repeat=3, memory=True):
+    # Best of `repeat` timed runs, then one extra run under tracemalloc for the peak,
+    # since tracing slows everything down
+    seconds = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        seconds.append(time.perf_counter() - start)
+    peak = None
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return seconds, peak
+
+
+def run_benchmarks(rows=(10000,), groups=GROUPS, repeat=3, memory=True, config_values=1000,
+                   workdir=None, only=None):
+    own_workdir = workdir is None
+    workdir = workdir or tempfile.mkdtemp(prefix="benchmarks_")
+    os.makedirs(workdir, exist_ok=True)
+    results = []
+
+    def record(name, size, unit, func, extra):
+        if only and not re.search(only, name):
+            return
+        result = {"name": name, "size": size, "unit": unit, "seconds": None, "runs": [],
+                  "throughput": None, "peak_memory_bytes": None, "error": None}
+        result.update(extra)
+        if func is not None:
+            try:
+                # insert_data and friends print every statement; that is not what is being measured
+                with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                    runs, peak = measure(func, repeat, memory)
+                result.update(seconds=round(min(runs), 6), runs=[round(run, 6) for run in runs],
+                              throughput=round(size / min(runs), 1) if min(runs) > 0 else None,
+                              peak_memory_bytes=peak)
+            except Exception as e:
+                result["error"] = f"{type(e).__name__}: {e}"
+        results.append(result)
+        print(_format_result(result))
+
+    try:
+        with contextlib.ExitStack() as stack:
+            port = stack.enter_context(smtp_sink()) if "email" in groups else None
+            for size in rows:
+                frame = synthetic_frame(size)
+                if "sql" in groups:
+                    for name, func, extra in sql_benchmarks(frame, workdir):
+                        record(name, size, "rows", func, extra)
+                if "file" in groups:
+                    for name, func, extra in file_benchmarks(frame, workdir):
+                        record(name, size, "rows", func, extra)
+                if "email" in groups:
+                    for name, func, extra in email_benchmarks(frame, workdir, port):
+                        record(name, size, "rows", func, extra)
+            if "config" in groups:
+                for name, func, extra in config_benchmarks(config_values, workdir):
+                    record(name, config_values, "values", func, extra)
+    finally:
+        if own_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return {"created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "pandas": pd.__version__,
+            "repeat": repeat,
+            "results": results}
+
+
+def compare_results(baseline, current, threshold=1.2):
+    # A benchmark regressed when it is more than `threshold` times slower than the baseline
+    previous = {(result["name"], result["size"]): result for result in baseline["results"]}
+    report = []
+    for result in current["results"]:
+        before = previous.get((result["name"], result["size"]))
+        if before is None or not before.get("seconds") or not result.get("seconds"):
+            ratio = None
+        else:
+            ratio = result["seconds"] / before["seconds"]
+        memory_ratio = None
+        if before and before.get("peak_memory_bytes") and result.get("peak_memory_bytes"):
+            memory_ratio = result["peak_memory_bytes"] / before["peak_memory_bytes"]
+        report.append({"name": result["name"],
+                       "size": result["size"],
+                       "baseline_seconds": before.get("seconds") if before else None,
+                       "seconds": result.get("seconds"),
+                       "ratio": round(ratio, 3) if ratio is not None else None,
+                       "memory_ratio": round(memory_ratio, 3) if memory_ratio is not None else None,
+                       "regressed": ratio is not None and ratio > threshold,
+                       "error": result.get("error")})
+    return report
+
+
+def _format_result(result):
+    label = f"{result['name']:28} {result['size']:>10,} {result['unit']:6}"
+    if result.get("skipped"):
+        return f"{label} skipped: {result['skipped']}"
+    if result["error"]:
+        return f"{label} FAILED: {result['error']}"
+    peak = result["peak_memory_bytes"]
+    memory = f"{peak / 2 ** 20:9.1f} MiB" if peak is not None else ""
+    return f"{label} {result['seconds']:10.4f}s {result['throughput']:>14,.0f}/s {memory}"
+
+
+def _format_comparison(report, threshold):
+    lines = [f"{'benchmark':28} {'size':>10} {'baseline':>10} {'current':>10} {'ratio':>7} {'memory':>7}"]
+    for row in report:
+        baseline = f"{row['baseline_seconds']:.4f}" if row["baseline_seconds"] is not None else "-"
+        current = f"{row['seconds']:.4f}" if row["seconds"] is not None else "-"
+        ratio = f"{row['ratio']:.2f}" if row["ratio"] is not None else "-"
+        memory = f"{row['memory_ratio']:.2f}" if row["memory_ratio"] is not None else "-"
+        flag = f"  SLOWER (> {threshold:.2f}x)" if row["regressed"] else (f"  {row['error']}" if row["error"] else "")
+        lines.append(f"{row['name']:28} {row['size']:>10,} {baseline:>10} {current:>10} {ratio:>7} {memory:>7}{flag}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m Framework.benchmarks",
+                                     description="Benchmark the framework's hot paths against local stand-ins")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="Run the benchmarks and write the results as JSON")
+    run.add_argument("--rows", type=int, nargs="+", default=[10000], help="Row counts to generate, e.g. 10000 1000000")
+    run.add_argument("--groups", nargs="+", choices=GROUPS, default=list(GROUPS))
+    run.add_argument("--only", help="Regular expression; only benchmarks whose name matches are run")
+    run.add_argument("--repeat", type=int, default=3, help="Timed runs per benchmark; the best one is kept")
+    run.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc run that measures peak memory")
+    run.add_argument("--config-values", type=int, default=1000, help="Number of values in the benchmark config")
+    run.add_argument("--workdir", help="Keep generated files here and reuse them on later runs")
+    run.add_argument("--output", default="benchmark_results.json")
+    compare = commands.add_parser("compare", help="Compare two result files and flag slowdowns")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--threshold", type=float, default=1.2,
+                         help="Flag benchmarks that take more than this many times the baseline")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        results = run_benchmarks(rows=args.rows, groups=args.groups, repeat=args.repeat,
+                                 memory=not args.no_memory, config_values=args.config_values,
+                                 workdir=args.workdir, only=args.only)
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+        return 1 if any(result["error"] for result in results["results"]) else 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    report = compare_results(baseline, current, args.threshold)
+    print(_format_comparison(report, args.threshold))
+    regressed = [row for row in report if row["regressed"]]
+    if regressed:
+        print(f"{len(regressed)} benchmark(s) slower than {args.threshold:.2f}x the baseline")
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+# Reads job definitions from a JSON (or YAML) file and works out which jobs are due
+# without importing AutoApi or any job module; those are imported only for jobs that run.
+#
+# {"jobs": [{"source": "Func1",
+#            "function": "module_1.__main__:main",
+#            "schedule_method": "schedule_daily",
+#            "schedule_params": {"hour": 8},
+#            "arguments": {"test_run": false}}]}
+import datetime
+import importlib
+import json
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List
+
+from .run_journal import journal, slot_key
+from .schedule_rules import BusinessCalendar, rule_for
+
+
+class JobDefinition:
+    def __init__(self, source: str, function: str, schedule_method: str,
+                 schedule_params: Dict[str, Any] = None, arguments: Dict[str, Any] = None, enabled: bool = True):
+        # function is "package.module:callable"; a dotted path after the colon reaches attributes
+        if ":" not in function:
+            raise ValueError(f"Job {source}: function must look like 'package.module:callable', got {function!r}")
+        self.source = source
+        self.function = function
+        self.schedule_method = schedule_method
+        self.schedule_params = dict(schedule_params or {})
+        self.arguments = dict(arguments or {})
+        self.enabled = enabled
+
+    @classmethod
+    def from_dict(cls, entry: Dict[str, Any]) -> "JobDefinition":
+        unknown = set(entry) - {"source", "function", "schedule_method", "schedule_params", "arguments", "enabled"}
+        if unknown:
+            raise ValueError(f"Job {entry.get('source')}: unknown fields {sorted(unknown)}")
+        return cls(**entry)
+
+    def is_due(self, when: datetime.datetime = None, calendar: BusinessCalendar = None) -> bool:
+        # Same test ScheduledFunctionExecutor applies, so a job is only imported in an hour it
+        # will fire or when the journal has an earlier slot of it to finish
+        if not self.enabled:
+            return False
+        when = when or datetime.datetime.now()
+        rule = rule_for(self.schedule_method, self.schedule_params, calendar)
+        if rule.fires_within(when):
+            return True
+        slot = rule.last_at_or_before(when)
+        return slot is not None and journal.needs_rerun(slot_key(self.source, slot))
+
+    def load_function(self):
+        module_name, _, attribute = self.function.partition(":")
+        try:
+            target = importlib.import_module(module_name)
+        except ModuleNotFoundError as e:
+            # "package.Name:main" where Name is an attribute of package rather than a module
+            parent, _, name = module_name.rpartition(".")
+            if not parent or e.name != module_name:
+                raise
+            target = getattr(importlib.import_module(parent), name)
+        for part in attribute.split("."):
+            target = getattr(target, part)
+        return target
+
+    def executor(self, calendar: BusinessCalendar = None):
+        # Imports AutoApi and the job's module
+        from . import AutoApi
+        return AutoApi.ScheduledFunctionExecutor(function=self.load_function(),
+                                                 source=self.source,
+                                                 schedule_method=self.schedule_method,
+                                                 schedule_params=self.schedule_params,
+                                                 arguments=self.arguments,
+                                                 calendar=calendar)
+
+
+class JobRegistry:
+    def __init__(self, jobs: List[JobDefinition] = None):
+        self.jobs = list(jobs or [])
+        sources = [job.source for job in self.jobs]
+        duplicates = sorted({source for source in sources if sources.count(source) > 1})
+        if duplicates:
+            raise ValueError(f"Duplicate job sources: {duplicates}")
+
+    @classmethod
+    def from_file(cls, path: str) -> "JobRegistry":
+        with open(path, 'r') as f:
+            if path.lower().endswith(('.yml', '.yaml')):
+                try:
+                    import yaml
+                except ImportError:
+                    raise ImportError("YAML job files need PyYAML (pip install pyyaml); JSON works without it")
+                data = yaml.safe_load(f)
+            else:
+                data = json.load(f)
+        entries = data.get("jobs", []) if isinstance(data, dict) else data
+        return cls([JobDefinition.from_dict(entry) for entry in entries])
+
+    def due(self, when: datetime.datetime = None, calendar: BusinessCalendar = None) -> List[JobDefinition]:
+        when = when or datetime.datetime.now()
+        return [job for job in self.jobs if job.is_due(when, calendar)]
+
+    def executors(self, jobs: List[JobDefinition] = None, calendar: BusinessCalendar = None):
+        # Disabled jobs are left out unless they are passed in explicitly
+        if jobs is None:
+            jobs = [job for job in self.jobs if job.enabled]
+        return [job.executor(calendar) for job in jobs]
+
+
+class ImportProfile:
+    # Records how long each labelled step takes and how many modules it imports.
+    # For a per-module breakdown run python -X importtime instead.
+    def __init__(self):
+        self.steps = []
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def measure(self, label: str):
+        before = len(sys.modules)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append((label, time.perf_counter() - start, len(sys.modules) - before))
+
+    def report(self) -> str:
+        lines = [f"{'step':40} {'ms':>9} {'modules':>8}"]
+        for label, seconds, modules in self.steps:
+            lines.append(f"{label[:40]:40} {seconds * 1000:>9.1f} {modules:>8}")
+        lines.append(f"{'total since profile start':40} {(time.perf_counter() - self._started) * 1000:>9.1f} "
+                     f"{len(sys.modules):>8}")
+        return "\n".join(lines)
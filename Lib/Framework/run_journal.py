@@ -0,0 +1,202 @@
+import datetime
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Job statuses
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+def slot_key(source, slot):
+    # One journal entry per job and schedule slot, e.g. "Func1:2024-05-01T08:00:00"; a
+    # rerun in a later hour uses the same key, so it finds the slot's checkpoints
+    return f"{source}:{slot.isoformat()}"
+
+
+class RunJournal:
+    # Durable record of which jobs started, finished or failed, plus the checkpoints long
+    # chunked loads leave behind, so a restarted run can skip or resume work.
+    # Does nothing until configure() is given a path.
+    def __init__(self, path=None, heartbeat_interval=30, stale_after=120):
+        self.path = None
+        # A running job touches its entry every heartbeat_interval seconds; one that has not
+        # for stale_after seconds belongs to a process that died
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self._local = threading.local()
+        if path is not None:
+            self.configure(path)
+
+    def configure(self, path):
+        self.path = path
+        with self._connect() as connection:
+            # WAL lets the daemon's job threads write while others read
+            connection.execute("pragma journal_mode=wal")
+            connection.execute("""
+                create table if not exists jobs (
+                    job_key text primary key,
+                    job text not null,
+                    status text not null,
+                    attempts integer not null,
+                    started_at text not null,
+                    finished_at text,
+                    error text,
+                    heartbeat_at text)""")
+            if "heartbeat_at" not in [row[1] for row in connection.execute("pragma table_info(jobs)")]:
+                connection.execute("alter table jobs add column heartbeat_at text")
+            connection.execute("""
+                create table if not exists checkpoints (
+                    job_key text not null,
+                    name text not null,
+                    value text not null,
+                    updated_at text not null,
+                    primary key (job_key, name))""")
+        return self
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    @contextmanager
+    def job(self, job_key, job=None):
+        # job_key names one execution slot (see slot_key); a job that already succeeded under
+        # the same key should be skipped (see is_complete)
+        if not self.enabled:
+            yield
+            return
+        now = self._now()
+        with self._connect() as connection:
+            connection.execute("""
+                insert into jobs values (?, ?, ?, 1, ?, null, null, ?)
+                on conflict (job_key) do update set
+                    status = excluded.status, attempts = attempts + 1, started_at = excluded.started_at,
+                    finished_at = null, error = null, heartbeat_at = excluded.heartbeat_at""",
+                               (job_key, job or job_key, RUNNING, now, now))
+        previous = getattr(self._local, "job_key", None), getattr(self._local, "claimed", None)
+        self._local.job_key = job_key
+        self._local.claimed = {}
+        stopped = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job_key, stopped), daemon=True)
+        heartbeat.start()
+        try:
+            yield
+        except BaseException as e:
+            stopped.set()
+            self._finish(job_key, FAILED, f"{type(e).__name__}: {e}")
+            raise
+        else:
+            stopped.set()
+            self._finish(job_key, SUCCEEDED)
+        finally:
+            stopped.set()
+            self._local.job_key, self._local.claimed = previous
+
+    def is_complete(self, job_key):
+        return self.status(job_key) == SUCCEEDED
+
+    def status(self, job_key):
+        if not self.enabled:
+            return None
+        with self._connect() as connection:
+            row = connection.execute("select status from jobs where job_key = ?", (job_key,)).fetchone()
+        return row[0] if row else None
+
+    def needs_rerun(self, job_key):
+        # True for a slot that failed, or that was left running by a process that died
+        if not self.enabled:
+            return False
+        with self._connect() as connection:
+            row = connection.execute("select status, heartbeat_at from jobs where job_key = ?",
+                                     (job_key,)).fetchone()
+        if row is None:
+            return False
+        status, heartbeat_at = row
+        if status == FAILED:
+            return True
+        if status != RUNNING:
+            return False
+        # Entries written before heartbeats existed count as abandoned
+        if heartbeat_at is None:
+            return True
+        silent = datetime.datetime.now() - datetime.datetime.fromisoformat(heartbeat_at)
+        return silent.total_seconds() > self.stale_after
+
+    def current(self):
+        return getattr(self._local, "job_key", None)
+
+    def claim(self, name):
+        # Gives each load in a run of the job its own checkpoint: the second load under the same
+        # name becomes "name#2" and so on. A finished load keeps its checkpoint at its full row
+        # count, so a rerun of the slot makes the same calls in the same order, skips the loads
+        # that finished and resumes the one that was interrupted.
+        claimed = getattr(self._local, "claimed", None)
+        if claimed is None:
+            return name
+        claimed[name] = claimed.get(name, 0) + 1
+        return name if claimed[name] == 1 else f"{name}#{claimed[name]}"
+
+    def checkpoint(self, name, value, job_key=None):
+        # Saves value (anything JSON can hold) under name for the running job
+        job_key = job_key or self.current()
+        if not self.enabled or job_key is None:
+            return
+        with self._connect() as connection:
+            connection.execute("insert or replace into checkpoints values (?, ?, ?, ?)",
+                               (job_key, name, json.dumps(value, default=str), self._now()))
+
+    def last_checkpoint(self, name, default=None, job_key=None):
+        job_key = job_key or self.current()
+        if not self.enabled or job_key is None:
+            return default
+        with self._connect() as connection:
+            row = connection.execute("select value from checkpoints where job_key = ? and name = ?",
+                                     (job_key, name)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def history(self, limit=50):
+        if not self.enabled:
+            return []
+        with self._connect() as connection:
+            rows = connection.execute("""
+                select job_key, job, status, attempts, started_at, finished_at, error
+                from jobs order by started_at desc limit ?""", (limit,)).fetchall()
+        return [dict(zip(("job_key", "job", "status", "attempts", "started_at", "finished_at", "error"), row))
+                for row in rows]
+
+    def _heartbeat(self, job_key, stopped):
+        while not stopped.wait(self.heartbeat_interval):
+            try:
+                with self._connect() as connection:
+                    connection.execute("update jobs set heartbeat_at = ? where job_key = ? and status = ?",
+                                       (self._now(), job_key, RUNNING))
+            except sqlite3.Error:
+                # A busy journal only delays the heartbeat, the next one will get through
+                pass
+
+    def _finish(self, job_key, status, error=None):
+        with self._connect() as connection:
+            connection.execute("update jobs set status = ?, finished_at = ?, error = ? where job_key = ?",
+                               (status, self._now(), error, job_key))
+            if status == SUCCEEDED:
+                # Checkpoints only matter for resuming unfinished work
+                connection.execute("delete from checkpoints where job_key = ?", (job_key,))
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _now():
+        return datetime.datetime.now().isoformat(timespec="seconds")
+
+
+# Shared by the whole framework; call journal.configure(path) at start-up to switch it on
+journal = RunJournal()
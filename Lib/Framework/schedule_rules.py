@@ -0,0 +1,287 @@
+import bisect
+import calendar
+import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+# Anything that does not fire within this many years is treated as never firing
+MAX_YEARS = 8
+
+MONTH_NAMES = {name.lower(): number for number, name in enumerate(calendar.month_abbr) if name}
+# Cron counts weekdays from Sunday = 0 (7 is accepted as Sunday too)
+WEEKDAY_NAMES = {"sun": 0, "mon": 1, "tue": 2, "wed": 3, "thu": 4, "fri": 5, "sat": 6}
+ALIASES = {"@yearly": "0 0 1 1 *", "@annually": "0 0 1 1 *", "@monthly": "0 0 1 * *",
+           "@weekly": "0 0 * * 0", "@daily": "0 0 * * *", "@midnight": "0 0 * * *",
+           "@hourly": "0 * * * *"}
+
+
+class BusinessCalendar:
+    def __init__(self, holidays: Iterable[datetime.date] = (), weekend: Iterable[int] = (5, 6)):
+        # weekend uses Python weekdays, Monday = 0
+        self.holidays = {self._as_date(day) for day in holidays}
+        self.weekend = set(weekend)
+        self._month_cache = {}
+
+    def is_business_day(self, day: datetime.date) -> bool:
+        day = self._as_date(day)
+        return day.weekday() not in self.weekend and day not in self.holidays
+
+    def business_days(self, year: int, month: int) -> List[int]:
+        # Days of the month that are business days, worked out once per month
+        key = (year, month)
+        if key not in self._month_cache:
+            self._month_cache[key] = [day for day in range(1, calendar.monthrange(year, month)[1] + 1)
+                                      if self.is_business_day(datetime.date(year, month, day))]
+        return self._month_cache[key]
+
+    def nth_business_day(self, year: int, month: int, n: int) -> Optional[int]:
+        # n counts from 1 at the start of the month, or from -1 at the end
+        days = self.business_days(year, month)
+        index = n - 1 if n > 0 else n
+        return days[index] if -len(days) <= index < len(days) else None
+
+    @staticmethod
+    def _as_date(day):
+        if isinstance(day, datetime.datetime):
+            return day.date()
+        if isinstance(day, str):
+            return datetime.date.fromisoformat(day)
+        return day
+
+
+class CalendarRule:
+    # Subclasses decide which days of a month fire; hours and minutes are shared
+    def __init__(self, minutes: Iterable[int], hours: Iterable[int], months: Iterable[int] = range(1, 13)):
+        self.minutes = sorted(set(minutes))
+        self.hours = sorted(set(hours))
+        self.months = set(months)
+        if not self.minutes or not self.hours or not self.months:
+            raise ValueError("A schedule needs at least one minute, hour and month")
+        self._day_cache = {}
+
+    def days(self, year: int, month: int) -> List[int]:
+        raise NotImplementedError
+
+    def next_after(self, after: datetime.datetime) -> Optional[datetime.datetime]:
+        # Jump month -> day -> hour -> minute instead of stepping through time
+        start = after.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        year, month = start.year, start.month
+        day, hour, minute = start.day, start.hour, start.minute
+        for _ in range(12 * MAX_YEARS):
+            if month in self.months:
+                days = self._days(year, month)
+                for candidate_day in days[bisect.bisect_left(days, day):]:
+                    first_hour = hour if candidate_day == day else 0
+                    for candidate_hour in self.hours[bisect.bisect_left(self.hours, first_hour):]:
+                        first_minute = minute if (candidate_day, candidate_hour) == (day, hour) else 0
+                        position = bisect.bisect_left(self.minutes, first_minute)
+                        if position < len(self.minutes):
+                            return datetime.datetime(year, month, candidate_day, candidate_hour,
+                                                     self.minutes[position])
+            month += 1
+            if month > 12:
+                month = 1
+                year += 1
+            day, hour, minute = 1, 0, 0
+        return None
+
+    def last_at_or_before(self, when: datetime.datetime) -> Optional[datetime.datetime]:
+        # The same jumps as next_after, walking backwards from when
+        end = when.replace(second=0, microsecond=0)
+        year, month = end.year, end.month
+        day, hour, minute = end.day, end.hour, end.minute
+        for _ in range(12 * MAX_YEARS):
+            if month in self.months:
+                days = self._days(year, month)
+                for candidate_day in reversed(days[:bisect.bisect_right(days, day)]):
+                    last_hour = hour if candidate_day == day else 23
+                    for candidate_hour in reversed(self.hours[:bisect.bisect_right(self.hours, last_hour)]):
+                        last_minute = minute if (candidate_day, candidate_hour) == (day, hour) else 59
+                        position = bisect.bisect_right(self.minutes, last_minute)
+                        if position:
+                            return datetime.datetime(year, month, candidate_day, candidate_hour,
+                                                     self.minutes[position - 1])
+            month -= 1
+            if month < 1:
+                month = 12
+                year -= 1
+            day, hour, minute = 31, 23, 59
+        return None
+
+    def next_n(self, n: int, after: datetime.datetime = None) -> List[datetime.datetime]:
+        fires = []
+        for fire in self.iter_from(after):
+            if len(fires) == n:
+                break
+            fires.append(fire)
+        return fires
+
+    def fires_between(self, start: datetime.datetime, end: datetime.datetime) -> List[datetime.datetime]:
+        # Every fire time in [start, end)
+        fires = []
+        for fire in self.iter_from(start - datetime.timedelta(minutes=1)):
+            if fire >= end:
+                break
+            if fire >= start:
+                fires.append(fire)
+        return fires
+
+    def iter_from(self, after: datetime.datetime = None) -> Iterator[datetime.datetime]:
+        fire = after or datetime.datetime.now()
+        while True:
+            fire = self.next_after(fire)
+            if fire is None:
+                return
+            yield fire
+
+    def fires_within(self, when: datetime.datetime, window: datetime.timedelta = datetime.timedelta(hours=1)) -> bool:
+        # True when the rule fires inside the window (an hour by default) that contains `when`
+        seconds = int(window.total_seconds())
+        since_midnight = when.hour * 3600 + when.minute * 60 + when.second
+        start = when.replace(hour=0, minute=0, second=0, microsecond=0) + datetime.timedelta(
+            seconds=since_midnight - since_midnight % seconds)
+        fire = self.next_after(start - datetime.timedelta(minutes=1))
+        return fire is not None and fire < start + window
+
+    def _days(self, year, month):
+        key = (year, month)
+        if key not in self._day_cache:
+            self._day_cache[key] = self.days(year, month)
+        return self._day_cache[key]
+
+
+class CronRule(CalendarRule):
+    def __init__(self, expression: str, week_parity: str = None, day_and_weekday: bool = False):
+        # week_parity ('even'/'odd') limits firing to ISO weeks with that parity;
+        # day_and_weekday requires both the day-of-month and weekday fields to match
+        # instead of cron's usual either/or
+        self.expression = expression
+        fields = ALIASES.get(expression.strip().lower(), expression).split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields (minute hour day month weekday): {expression!r}")
+        if week_parity not in (None, "even", "odd"):
+            raise ValueError("week_parity must be 'even', 'odd' or None")
+        minutes = self._parse(fields[0], 0, 59)
+        hours = self._parse(fields[1], 0, 23)
+        self.month_days = self._parse(fields[2], 1, 31)
+        months = self._parse(fields[3], 1, 12, MONTH_NAMES)
+        # Store weekdays the Python way, Monday = 0
+        self.weekdays = {(day - 1) % 7 for day in self._parse(fields[4], 0, 7, WEEKDAY_NAMES)}
+        self.any_day = fields[2] in ("*", "?")
+        self.any_weekday = fields[4] in ("*", "?")
+        self.week_parity = week_parity
+        self.day_and_weekday = day_and_weekday
+        super().__init__(minutes, hours, months)
+
+    def days(self, year, month):
+        matches = []
+        for day in range(1, calendar.monthrange(year, month)[1] + 1):
+            date = datetime.date(year, month, day)
+            in_month_days = day in self.month_days
+            in_weekdays = date.weekday() in self.weekdays
+            if self.any_day and self.any_weekday:
+                fires = True
+            elif self.any_day:
+                fires = in_weekdays
+            elif self.any_weekday:
+                fires = in_month_days
+            elif self.day_and_weekday:
+                fires = in_month_days and in_weekdays
+            else:
+                fires = in_month_days or in_weekdays
+            if fires and self.week_parity is not None:
+                fires = (date.isocalendar()[1] % 2 == 0) == (self.week_parity == "even")
+            if fires:
+                matches.append(day)
+        return matches
+
+    def __repr__(self):
+        return f"CronRule({self.expression!r})"
+
+    @staticmethod
+    def _parse(field, low, high, names=None):
+        values = set()
+        for part in field.lower().split(","):
+            step = 1
+            if "/" in part:
+                part, step = part.split("/", 1)
+                step = int(step)
+                if step < 1:
+                    raise ValueError(f"Invalid step in cron field {field!r}")
+            if part in ("*", "?"):
+                start, end = low, high
+            elif "-" in part:
+                start, end = [CronRule._value(item, names) for item in part.split("-", 1)]
+            else:
+                start = CronRule._value(part, names)
+                end = high if step > 1 else start
+            if not low <= start <= end <= high:
+                raise ValueError(f"Cron field {field!r} is outside {low}-{high}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    @staticmethod
+    def _value(item, names):
+        if names and item in names:
+            return names[item]
+        return int(item)
+
+
+class BusinessDayRule(CalendarRule):
+    def __init__(self, n: int, hour: int, minute: int = 0, business_calendar: BusinessCalendar = None):
+        # n-th business day of every month, counting from the end when n is negative
+        if n == 0:
+            raise ValueError("n counts from 1 (or from -1 at the end of the month)")
+        self.n = n
+        self.calendar = business_calendar or BusinessCalendar()
+        super().__init__([minute], [hour])
+
+    def days(self, year, month):
+        day = self.calendar.nth_business_day(year, month, self.n)
+        return [day] if day is not None else []
+
+    def __repr__(self):
+        return f"BusinessDayRule(n={self.n}, hour={self.hours[0]})"
+
+
+def _weekdays(days):
+    # Scheduler days are Python weekdays (Monday = 0); cron wants Sunday = 0
+    return ",".join(str((day + 1) % 7) for day in days)
+
+
+def build_rule(schedule_method: str, schedule_params: Dict[str, Any],
+               business_calendar: BusinessCalendar = None) -> CalendarRule:
+    hour = schedule_params.get("hour")
+    builders = {
+        "schedule_cron": lambda: CronRule(schedule_params["expression"]),
+        "schedule_daily": lambda: CronRule(f"0 {hour} * * *"),
+        "schedule_weekly": lambda: CronRule(f"0 {hour} * * {_weekdays([schedule_params['day']])}"),
+        "schedule_weekdays": lambda: CronRule(f"0 {hour} * * 1-5"),
+        "schedule_biweekly_even": lambda: CronRule(f"0 {hour} * * {_weekdays(schedule_params['days'])}",
+                                                   week_parity="even"),
+        "schedule_biweekly_odd": lambda: CronRule(f"0 {hour} * * {_weekdays(schedule_params['days'])}",
+                                                  week_parity="odd"),
+        "schedule_first_and_third_week": lambda: CronRule(
+            f"0 {hour} 1-7,15-21 * {_weekdays(schedule_params['days'])}", day_and_weekday=True),
+        "schedule_monthly": lambda: CronRule(f"0 {hour} {schedule_params['day']} * *"),
+        "schedule_first_business_day": lambda: BusinessDayRule(1, hour, business_calendar=business_calendar),
+        "schedule_second_business_day": lambda: BusinessDayRule(2, hour, business_calendar=business_calendar),
+        "schedule_first_and_fifteenth": lambda: CronRule(f"0 {hour} 1,15 * *"),
+    }
+    if schedule_method not in builders:
+        raise ValueError(f"Unknown schedule method: {schedule_method}")
+    return builders[schedule_method]()
+
+
+_rule_cache = {}
+
+
+def rule_for(schedule_method: str, schedule_params: Dict[str, Any],
+             business_calendar: BusinessCalendar = None) -> CalendarRule:
+    # Each distinct schedule is compiled once per process
+    key = (schedule_method,
+           tuple(sorted((name, tuple(value) if isinstance(value, list) else value)
+                        for name, value in schedule_params.items())),
+           business_calendar)
+    if key not in _rule_cache:
+        _rule_cache[key] = build_rule(schedule_method, schedule_params, business_calendar)
+    return _rule_cache[key]
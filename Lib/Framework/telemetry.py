@@ -0,0 +1,316 @@
+import datetime
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, List
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+
+def current_rss_bytes():
+    # Resident set size of this process right now, or None when it cannot be read
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return None
+
+
+def peak_rss_bytes():
+    # Peak resident set size of this process so far, or None when it cannot be read
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS bytes
+        return peak if sys.platform == "darwin" else peak * 1024
+    try:
+        import psutil
+        memory = psutil.Process().memory_info()
+        return getattr(memory, "peak_wset", memory.rss)
+    except ImportError:
+        return None
+
+
+class Span:
+    def __init__(self, telemetry, name, parent_id=None, **attributes):
+        self.telemetry = telemetry
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.counters = {}
+        self.status = "ok"
+        self.error = None
+        self.started_at = datetime.datetime.now()
+        self.wall_seconds = None
+        self.cpu_seconds = None
+        # How much the process grew while the span ran; the lifetime peak would read the same
+        # for every span after the largest job and hide per-job regressions
+        self.rss_growth_bytes = None
+        self._rss_start = current_rss_bytes() if telemetry.recording else None
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.thread_time()
+
+    def add(self, **counters):
+        # e.g. span.add(rows_read=len(df), bytes_sent=size)
+        for counter, value in counters.items():
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def fail(self, error):
+        self.status = "error"
+        self.error = f"{type(error).__name__}: {error}"
+
+    def finish(self):
+        if self.wall_seconds is not None:
+            return
+        self.wall_seconds = time.perf_counter() - self._wall_start
+        # CPU time of the thread that ran the span; work handed to other threads is not included
+        self.cpu_seconds = time.thread_time() - self._cpu_start
+        if self._rss_start is not None:
+            rss = current_rss_bytes()
+            self.rss_growth_bytes = rss - self._rss_start if rss is not None else None
+        self.telemetry._record(self)
+
+    def as_dict(self):
+        return {"run_id": self.telemetry.run_id,
+                "span_id": self.span_id,
+                "parent_id": self.parent_id,
+                "name": self.name,
+                "started_at": self.started_at.isoformat(),
+                "wall_seconds": round(self.wall_seconds or 0.0, 6),
+                "cpu_seconds": round(self.cpu_seconds or 0.0, 6),
+                "rss_growth_bytes": self.rss_growth_bytes,
+                "counters": self.counters,
+                "attributes": self.attributes,
+                "status": self.status,
+                "error": self.error}
+
+
+class Telemetry:
+    def __init__(self, run_id=None, exporters=None, enabled=True, max_spans=10000):
+        self.run_id = run_id or datetime.datetime.now().strftime("%Y%m%d%H%M%S-") + uuid.uuid4().hex[:6]
+        self.exporters = list(exporters or [])
+        self.enabled = enabled
+        # Spans waiting for flush(); past max_spans the oldest are dropped and counted, so a
+        # process that never flushes cannot grow without bound
+        self.max_spans = max_spans
+        self.dropped = 0
+        self.spans = deque()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def span(self, name, **attributes):
+        span = self.start(name, **attributes)
+        stack = self._stack()
+        stack.append(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.fail(e)
+            raise
+        finally:
+            stack.pop()
+            span.finish()
+
+    def start(self, name, **attributes):
+        # For work that cannot sit inside a with block (e.g. generators); call span.finish()
+        stack = self._stack()
+        return Span(self, name, parent_id=stack[-1].span_id if stack else None, **attributes)
+
+    def current(self):
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    def flush(self):
+        # Hand every finished span to the exporters and start a fresh batch
+        with self._lock:
+            spans, self.spans = self.spans, deque()
+        records = [span.as_dict() for span in spans]
+        for exporter in self.exporters:
+            exporter.export(self.run_id, records)
+        return records
+
+    @property
+    def recording(self):
+        # Spans are only kept once an exporter is registered to receive them
+        return self.enabled and bool(self.exporters)
+
+    def _record(self, span):
+        if self.recording:
+            with self._lock:
+                if len(self.spans) >= self.max_spans:
+                    self.spans.popleft()
+                    self.dropped += 1
+                self.spans.append(span)
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+
+class JsonlExporter:
+    def __init__(self, path):
+        self.path = path
+
+    def export(self, run_id, records):
+        with open(self.path, "a") as f:
+            for record in records:
+                f.write(json.dumps(record, default=str) + "\n")
+
+
+class SqliteExporter:
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as connection:
+            connection.execute("""
+                create table if not exists spans (
+                    run_id text not null,
+                    span_id text primary key,
+                    parent_id text,
+                    name text not null,
+                    started_at text not null,
+                    wall_seconds real,
+                    cpu_seconds real,
+                    rss_growth_bytes integer,
+                    counters text,
+                    attributes text,
+                    status text,
+                    error text)""")
+            # History files written before spans recorded RSS growth keep their old column
+            if "rss_growth_bytes" not in [row[1] for row in connection.execute("pragma table_info(spans)")]:
+                connection.execute("alter table spans add column rss_growth_bytes integer")
+            connection.execute("create index if not exists ix_spans_name on spans (name, started_at)")
+
+    def export(self, run_id, records):
+        with self._connect() as connection:
+            connection.executemany(
+                """insert or replace into spans (run_id, span_id, parent_id, name, started_at, wall_seconds,
+                                                 cpu_seconds, rss_growth_bytes, counters, attributes, status, error)
+                   values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                [(record["run_id"], record["span_id"], record["parent_id"], record["name"],
+                  record["started_at"], record["wall_seconds"], record["cpu_seconds"],
+                  record["rss_growth_bytes"], json.dumps(record["counters"]),
+                  json.dumps(record["attributes"], default=str), record["status"], record["error"])
+                 for record in records])
+
+    def compare_to_baseline(self, run_id, window=10, threshold=1.25):
+        # Total wall time per span name in this run against the median of the previous runs
+        with self._connect() as connection:
+            current = dict(connection.execute(
+                "select name, sum(wall_seconds) from spans where run_id = ? group by name", (run_id,)).fetchall())
+            report = []
+            for name, seconds in sorted(current.items()):
+                history = [row[0] for row in connection.execute("""
+                    select sum(wall_seconds) from spans
+                    where name = ? and run_id <> ?
+                    group by run_id
+                    order by min(started_at) desc
+                    limit ?""", (name, run_id, window)).fetchall()]
+                baseline = statistics.median(history) if history else None
+                ratio = seconds / baseline if baseline else None
+                report.append({"name": name,
+                               "seconds": round(seconds, 3),
+                               "baseline_seconds": round(baseline, 3) if baseline is not None else None,
+                               "runs_in_baseline": len(history),
+                               "ratio": round(ratio, 2) if ratio is not None else None,
+                               "regressed": ratio is not None and ratio > threshold})
+        return report
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+
+class PrometheusTextfileExporter:
+    def __init__(self, path, prefix="automation"):
+        # path should sit in node_exporter's --collector.textfile.directory
+        self.path = path
+        self.prefix = prefix
+        # Running totals per span name for the life of the process; the daemon flushes after
+        # every job, and each rewrite of the file must still show every job seen so far
+        self.totals = {}
+        self._lock = threading.Lock()
+
+    def export(self, run_id, records):
+        with self._lock:
+            self._add(records)
+            self._write()
+
+    def _add(self, records):
+        totals = self.totals
+        for record in records:
+            name = record["name"]
+            entry = totals.setdefault(name, {"wall_seconds": 0.0, "cpu_seconds": 0.0, "spans": 0, "errors": 0})
+            entry["wall_seconds"] += record["wall_seconds"]
+            entry["cpu_seconds"] += record["cpu_seconds"]
+            entry["spans"] += 1
+            entry["errors"] += record["status"] == "error"
+            if record["rss_growth_bytes"] is not None:
+                entry["max_rss_growth_bytes"] = max(entry.get("max_rss_growth_bytes", 0), record["rss_growth_bytes"])
+            for counter, value in record["counters"].items():
+                entry[counter] = entry.get(counter, 0) + value
+
+    def _write(self):
+        totals = self.totals
+        lines = []
+        metric_names = sorted({metric for entry in totals.values() for metric in entry})
+        for metric in metric_names:
+            lines.append(f"# TYPE {self.prefix}_{metric} gauge")
+            for name, entry in sorted(totals.items()):
+                if metric in entry:
+                    lines.append(f'{self.prefix}_{metric}{{span="{self._escape(name)}"}} {entry[metric]}')
+        peak = peak_rss_bytes()
+        if peak:
+            lines.append(f"# TYPE {self.prefix}_peak_rss_bytes gauge")
+            lines.append(f"{self.prefix}_peak_rss_bytes {peak}")
+        lines.append(f"# TYPE {self.prefix}_last_run_timestamp_seconds gauge")
+        lines.append(f"{self.prefix}_last_run_timestamp_seconds {time.time():.0f}")
+        # node_exporter must never read a half-written file
+        partial = f"{self.path}.{os.getpid()}.tmp"
+        with open(partial, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(partial, self.path)
+
+    @staticmethod
+    def _escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_report(report: List[Dict[str, Any]]) -> str:
+    lines = [f"{'span':40} {'seconds':>9} {'baseline':>9} {'ratio':>6}"]
+    for row in report:
+        baseline = f"{row['baseline_seconds']:.3f}" if row["baseline_seconds"] is not None else "-"
+        ratio = f"{row['ratio']:.2f}" if row["ratio"] is not None else "-"
+        flag = "  REGRESSED" if row["regressed"] else ""
+        lines.append(f"{row['name'][:40]:40} {row['seconds']:>9.3f} {baseline:>9} {ratio:>6}{flag}")
+    return "\n".join(lines)
+
+
+# Shared by the whole framework; add exporters to it at start-up (nothing is kept until one is
+# added) and flush() at the end of a run
+telemetry = Telemetry()
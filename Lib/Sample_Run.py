@@ -1,16 +1,20 @@
-import datetime
-import os
-import sys
-import logging
-from io import StringIO
-from getpass import getpass
-from Framework import AutoApi
-from Framework.auth_manager import AuthenticationManager
+from Framework.job_registry import ImportProfile
+# Started before anything else is imported so --profile-imports sees the whole start-up
+profile = ImportProfile()
+with profile.measure("stdlib, auth, telemetry, job registry"):
+    import datetime
+    import os
+    import sys
+    import logging
+    from io import StringIO
+    from getpass import getpass
+    from Framework.auth_manager import AuthenticationManager
+    from Framework.telemetry import telemetry, JsonlExporter, SqliteExporter, PrometheusTextfileExporter, format_report
+    from Framework.job_registry import JobRegistry
+    from Framework.run_journal import journal
 
-# import functions
-from module_1 import __main__ as Func1
-from module_2 import __main__ as Func2
-from module_3 import Func3
+# Jobs are declared in jobs.json; AutoApi and the job modules are only imported for jobs that are due
+JOBS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "jobs.json")
 
 def setup_logger(log_output):
     # Create a logger
@@ -31,66 +35,88 @@ def setup_logger(log_output):
     logger.addHandler(file_handler)
     return logger
 
-log_output = StringIO()
-logger = setup_logger(log_output)
-auth_manager = AuthenticationManager(r"super_secret.properties")
-username = input("Enter your username: ")
-password = getpass("Enter your password: ")
+def main():
+    log_output = StringIO()
+    logger = setup_logger(log_output)
+    # Per-job timings, memory and row/byte counts; the sqlite history is the baseline for regressions
+    telemetry_history = SqliteExporter("telemetry.db")
+    telemetry.exporters += [JsonlExporter("telemetry.jsonl"), telemetry_history,
+                            PrometheusTextfileExporter(os.environ.get("AUTOMATION_PROM_FILE", "automation.prom"))]
+    # Records which schedule slots finished and where long loads got to, so a rerun after a crash
+    # skips finished jobs and resumes unfinished ones from their checkpoints
+    journal.configure("run_journal.db")
+    auth_manager = AuthenticationManager(r"super_secret.properties")
+    username = input("Enter your username: ")
+    password = getpass("Enter your password: ")
 
-if auth_manager.authenticate(username, password):
-    go = False
-    RUN_NUM = datetime.datetime.now().hour if go else 8
-    scheduled_functions = [AutoApi.ScheduledFunctionExecutor(function=Func1.main,
-                                  source="Func1",
-                                  schedule_method='schedule_daily',
-                                  schedule_params={'hour': RUN_NUM},
-                                  arguments={'test_run': False}),
-        AutoApi.ScheduledFunctionExecutor(function=Func3.main,
-                                  source="Func3",
-                                  schedule_method='schedule_daily',
-                                  schedule_params={'hour': RUN_NUM},
-                                  arguments={'test_run': False}),
-        AutoApi.ScheduledFunctionExecutor(function=Func2.main,
-                                  source="Func2",
-                                  schedule_method='schedule_daily',
-                                  schedule_params={'hour': RUN_NUM},
-                                  arguments={'test_run': False})]
-    error_occurred = False
-    for scheduled_function in scheduled_functions:
-        try:
-            logger.info(
-                f"Executing package/function:\t{scheduled_function.source}; {scheduled_function.function_name}; {scheduled_function.schedule_method}; {scheduled_function.schedule_params}")
-            schedule_method = getattr(scheduled_function.scheduler, scheduled_function.schedule_method)
-            schedule_method(**scheduled_function.schedule_params, **scheduled_function.arguments)
-        except Exception as e:
-            logger.error(
-                f"Error executing function: {scheduled_function.source} -> {scheduled_function.function_name}\t {e}")
-            error_occurred = True
-    if not error_occurred:
-        logger.info("No errors occurred during execution.")
-else:
-    print("Authentication failed. Access denied.")
-    sys.exit(1)
+    if auth_manager.authenticate(username, password):
+        with profile.measure("read job registry"):
+            registry = JobRegistry.from_file(JOBS_FILE)
+        # Stay resident and fire every job on its own schedule instead of relying on an hourly cron
+        if "--daemon" in sys.argv:
+            from Framework import AutoApi
+            AutoApi.SchedulerDaemon(registry.executors(), max_workers=4, logger=logger,
+                                    state_file="scheduler_state.json").run_forever()
+            return
+        with profile.measure("find due jobs"):
+            due_jobs = registry.due()
+        scheduled_functions = []
+        for job in due_jobs:
+            with profile.measure(f"import {job.function}"):
+                scheduled_functions.append(job.executor())
+        if not due_jobs:
+            logger.info(f"No jobs due this hour ({len(registry.jobs)} registered).")
+        error_occurred = False
+        for scheduled_function in scheduled_functions:
+            try:
+                logger.info(
+                    f"Executing package/function:\t{scheduled_function.source}; {scheduled_function.function_name}; {scheduled_function.schedule_method}; {scheduled_function.schedule_params}")
+                scheduled_function.execute()
+            except Exception as e:
+                logger.error(
+                    f"Error executing function: {scheduled_function.source} -> {scheduled_function.function_name}\t {e}")
+                error_occurred = True
+        if due_jobs and not error_occurred:
+            logger.info("No errors occurred during execution.")
+        if due_jobs:
+            telemetry.flush()
+            logger.info(f"Run {telemetry.run_id} against recent runs:\n"
+                        f"{format_report(telemetry_history.compare_to_baseline(telemetry.run_id))}")
+    else:
+        print("Authentication failed. Access denied.")
+        sys.exit(1)
 
-log_text = log_output.getvalue()
-for handler in logger.handlers:
-    handler.close()
-    logger.removeHandler(handler)
-log_output.close()
-print(log_text)
+    log_text = log_output.getvalue()
+    for handler in logger.handlers:
+        handler.close()
+        logger.removeHandler(handler)
+    log_output.close()
+    print(log_text)
 
-__start__ = 8
-__stop__ = 23
-# Check if the current datetime is between 8 am and 23 pm
-current_hour = datetime.datetime.now().hour
-if current_hour >= __start__ and current_hour < __stop__:
-    AutoApi.EmailSender.send_mail(send_from='guy@company.com',
-                                     send_to=['someguy@somecompany.com'],
-                                     subject="Scheduled Automation Process Log",
-                                     message=log_text,
-                                     files=[], server="smtp.office365.com",
-                                     port=587, username='admin@company.com',
-                                     password='secretpassword', use_tls=True,
-                                     Bcc=None, Cc=None)
-else:
-    logger.info("Current time is not within the specified range for sending the email.")
\ No newline at end of file
+    __start__ = 8
+    __stop__ = 23
+    # Check if the current datetime is between 8 am and 23 pm
+    current_hour = datetime.datetime.now().hour
+    if "--profile-imports" in sys.argv:
+        print(profile.report())
+    if not due_jobs:
+        # Nothing ran, so there is no log worth mailing and no reason to import AutoApi
+        logger.info("No jobs ran, the log email is skipped.")
+    elif current_hour >= __start__ and current_hour < __stop__:
+        from Framework import AutoApi
+        AutoApi.EmailSender.send_mail(send_from='guy@company.com',
+                                         send_to=['someguy@somecompany.com'],
+                                         subject="Scheduled Automation Process Log",
+                                         message=log_text,
+                                         files=[], server="smtp.office365.com",
+                                         port=587, username='admin@company.com',
+                                         password='secretpassword', use_tls=True,
+                                         Bcc=None, Cc=None)
+    else:
+        logger.info("Current time is not within the specified range for sending the email.")
+
+
+# Worker processes started by READ_MANY or the process backend import this module again;
+# the guard keeps them from prompting for a login and running the jobs themselves
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import threading
+import time
+import unittest
+
+from Framework.AutoApi import ParallelJob, ParallelRunner
+
+
+class Tracker:
+    # Counts calls and how many run at once
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+        self.calls = 0
+
+    def run(self, value, seconds=0.05):
+        with self.lock:
+            self.calls += 1
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        try:
+            time.sleep(seconds)
+            return value
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+class ResourceLimitTest(unittest.TestCase):
+    def test_jobs_sharing_a_resource_run_one_at_a_time(self):
+        tracker = Tracker()
+        jobs = [ParallelJob(tracker.run, (number,), resource="db") for number in range(5)]
+        results = ParallelRunner.run_parallel(jobs, pool_size=5, resource_limits={"db": 1})
+        self.assertEqual(results, [0, 1, 2, 3, 4])
+        self.assertEqual(tracker.peak, 1)
+
+    def test_queued_jobs_do_not_hold_up_other_jobs(self):
+        tracker = Tracker()
+        finished = {}
+
+        def other():
+            finished["other"] = time.perf_counter()
+
+        jobs = [ParallelJob(tracker.run, (number, 0.1), resource="db") for number in range(4)]
+        jobs.append(ParallelJob(other))
+        start = time.perf_counter()
+        ParallelRunner.run_parallel(jobs, pool_size=2, resource_limits={"db": 1})
+        # The db jobs take 0.4s one after another; the other job only waits for a free thread
+        self.assertLess(finished["other"] - start, 0.2)
+
+    def test_timed_out_attempt_keeps_its_slot_until_it_finishes(self):
+        tracker = Tracker()
+        jobs = [ParallelJob(tracker.run, (0, 0.3), resource="db", timeout=0.05),
+                ParallelJob(tracker.run, (1, 0.01), resource="db")]
+        results = ParallelRunner.run_parallel(jobs, pool_size=4, resource_limits={"db": 1},
+                                              return_exceptions=True)
+        self.assertIsInstance(results[0], TimeoutError)
+        self.assertEqual(results[1], 1)
+        self.assertEqual(tracker.peak, 1)
+
+
+class RetryTest(unittest.TestCase):
+    def test_timeout_is_retried(self):
+        attempts = []
+
+        def slow_first_time():
+            attempts.append(time.perf_counter())
+            if len(attempts) == 1:
+                time.sleep(0.3)
+            return "done"
+
+        results = ParallelRunner.run_parallel([ParallelJob(slow_first_time, timeout=0.05)], retries=1, backoff=0.01)
+        self.assertEqual(results, ["done"])
+        self.assertEqual(len(attempts), 2)
+
+    def test_timeout_after_last_retry(self):
+        results = ParallelRunner.run_parallel([ParallelJob(time.sleep, (0.3,), timeout=0.05)], retries=1,
+                                              backoff=0.01, return_exceptions=True)
+        self.assertIsInstance(results[0], TimeoutError)
+
+    def test_failures_are_retried_with_backoff(self):
+        attempts = []
+
+        def flaky():
+            attempts.append(time.perf_counter())
+            if len(attempts) < 3:
+                raise ValueError("not yet")
+            return len(attempts)
+
+        self.assertEqual(ParallelRunner.run_parallel([(flaky, ())], retries=2, backoff=0.05), [3])
+        # 0.05s then 0.1s between attempts
+        self.assertGreaterEqual(attempts[2] - attempts[0], 0.15)
+
+    def test_job_retries_zero_overrides_the_run_default(self):
+        calls = []
+
+        def failing():
+            calls.append(1)
+            raise ValueError("always")
+
+        results = ParallelRunner.run_parallel([ParallelJob(failing, retries=0)], retries=3, backoff=0.01,
+                                              return_exceptions=True)
+        self.assertIsInstance(results[0], ValueError)
+        self.assertEqual(len(calls), 1)
+
+    def test_errors_are_raised_without_return_exceptions(self):
+        def failing():
+            raise KeyError("x")
+
+        with self.assertRaises(KeyError):
+            ParallelRunner.run_parallel([(failing, ())])
+
+    def test_finishing_at_the_timeout_settles_once(self):
+        # Completion and timeout race here; each attempt must be settled once, so a job that
+        # returned is never run again and no late result lands on a finished future
+        calls = [0] * 50
+        errors = []
+        hook = threading.excepthook
+        threading.excepthook = lambda args: errors.append(args.exc_value)
+        self.addCleanup(setattr, threading, "excepthook", hook)
+
+        def job(number):
+            calls[number] += 1
+            attempt = calls[number]
+            time.sleep(0.02)
+            return attempt
+
+        jobs = [ParallelJob(job, (number,), timeout=0.02) for number in range(50)]
+        results = ParallelRunner.run_parallel(jobs, pool_size=50, retries=1, backoff=0.05, return_exceptions=True)
+        # Long enough for any retry wrongly scheduled after a success to have run
+        time.sleep(0.3)
+        for number, result in enumerate(results):
+            self.assertEqual(calls[number], 2 if isinstance(result, TimeoutError) else result)
+        self.assertEqual(errors, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
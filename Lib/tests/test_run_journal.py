@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+from Framework import AutoApi
+from Framework.benchmarks import FakeCursor, FakeSqlServer
+from Framework.run_journal import RunJournal
+
+
+class ResumableLoadTest(unittest.TestCase):
+    def setUp(self):
+        handle, path = tempfile.mkstemp(suffix=".db")
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        for suffix in ("-wal", "-shm"):
+            self.addCleanup(lambda name=path + suffix: os.path.exists(name) and os.remove(name))
+        self.journal = RunJournal(path)
+        patcher = mock.patch.object(AutoApi, "journal", self.journal)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.server = FakeSqlServer()
+        self.server.create_table("dbo.t", pd.DataFrame({"id": [0], "value": [0.0]}))
+        self.sql = AutoApi.SqlOperations("Fake", "localhost", "db", "user", "password",
+                                         schema_cache=AutoApi.SchemaCache())
+        self.sql.pool = AutoApi.ConnectionPool(self.sql.connection_string, connect=self.server.connect)
+        self.first = pd.DataFrame({"id": range(3), "value": [1.0] * 3})
+        self.second = pd.DataFrame({"id": range(5), "value": [2.0] * 5})
+
+    def load(self, frame):
+        return self.sql.insert_data("dbo.t", frame, commit=True, batch_size=2, resumable=True)
+
+    def test_two_loads_into_one_table_in_one_job(self):
+        with self.journal.job("job:1"):
+            first = self.load(self.first)
+            second = self.load(self.second)
+        self.assertEqual((first["rows"], second["rows"]), (3, 5))
+        self.assertEqual((first["resumed_after"], second["resumed_after"]), (0, 0))
+        self.assertEqual(self.server.rows_written, 8)
+
+    def test_rerun_skips_finished_loads_and_resumes_the_interrupted_one(self):
+        executemany = FakeCursor.executemany
+        calls = []
+
+        def fail_on_fourth_batch(cursor, sql, rows):
+            calls.append(len(rows))
+            if len(calls) == 4:
+                raise RuntimeError("connection lost")
+            return executemany(cursor, sql, rows)
+
+        with mock.patch.object(FakeCursor, "executemany", fail_on_fourth_batch):
+            with self.assertRaises(RuntimeError):
+                with self.journal.job("job:1"):
+                    self.load(self.first)
+                    self.load(self.second)
+        # The first load and one batch of the second got through
+        self.assertEqual(self.server.rows_written, 5)
+        with self.journal.job("job:1"):
+            first = self.load(self.first)
+            second = self.load(self.second)
+        self.assertEqual((first["rows"], first["resumed_after"]), (0, 3))
+        self.assertEqual((second["rows"], second["resumed_after"]), (3, 2))
+        self.assertEqual(self.server.rows_written, 8)
+
+    def test_same_query_read_twice_in_one_job(self):
+        self.server.create_table("dbo.source", self.second)
+        query = "select * from dbo.source"
+        with self.journal.job("job:1"):
+            first = sum(len(chunk) for chunk in self.sql.read_data_chunks(query, chunk_size=2, resumable=True))
+            second = sum(len(chunk) for chunk in self.sql.read_data_chunks(query, chunk_size=2, resumable=True))
+        self.assertEqual((first, second), (5, 5))
+
+
+if __name__ == "__main__":
+    unittest.main()
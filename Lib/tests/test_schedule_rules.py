@@ -0,0 +1,205 @@
+import datetime
+import unittest
+
+from Framework.schedule_rules import BusinessCalendar, BusinessDayRule, CronRule, rule_for
+
+# The conditions the Scheduler.schedule_* methods checked before they were compiled into rules
+OLD_CONDITIONS = {
+    "schedule_weekly": lambda now, hour, day: now.weekday() == day and now.hour == hour,
+    "schedule_daily": lambda now, hour: now.hour == hour,
+    "schedule_weekdays": lambda now, hour: now.weekday() < 5 and now.hour == hour,
+    "schedule_biweekly_even": lambda now, hour, days: (now.weekday() in days and now.hour == hour
+                                                       and now.isocalendar()[1] % 2 == 0),
+    "schedule_biweekly_odd": lambda now, hour, days: (now.weekday() in days and now.hour == hour
+                                                      and now.isocalendar()[1] % 2 != 0),
+    "schedule_first_and_third_week": lambda now, hour, days: (now.weekday() in days and now.hour == hour
+                                                              and (now.day - 1) // 7 + 1 in [1, 3]),
+    "schedule_monthly": lambda now, hour, day: now.day == day and now.hour == hour,
+    "schedule_first_and_fifteenth": lambda now, hour: now.hour == hour and now.day in (1, 15),
+}
+
+PARAMS = {
+    "schedule_weekly": {"hour": 7, "day": 6},
+    "schedule_daily": {"hour": 0},
+    "schedule_weekdays": {"hour": 23},
+    "schedule_biweekly_even": {"hour": 5, "days": [0, 6]},
+    "schedule_biweekly_odd": {"hour": 5, "days": [3]},
+    "schedule_first_and_third_week": {"hour": 8, "days": [1, 4]},
+    "schedule_monthly": {"hour": 2, "day": 31},
+    "schedule_first_and_fifteenth": {"hour": 9},
+}
+
+
+def brute_force_next(rule, after, limit=datetime.timedelta(days=800)):
+    # Minute by minute, for checking the jumping search
+    fire = after.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+    while fire - after < limit:
+        if (fire.month in rule.months and fire.day in rule.days(fire.year, fire.month)
+                and fire.hour in rule.hours and fire.minute in rule.minutes):
+            return fire
+        fire += datetime.timedelta(minutes=1)
+    return None
+
+
+class ScheduleMethodsMatchOldConditionsTest(unittest.TestCase):
+    def test_hour_by_hour_over_two_years(self):
+        # Crosses two year ends, ISO week 53 of 2026 (week parity repeats) and months without a 31st
+        start = datetime.datetime(2025, 12, 20)
+        hours = int((datetime.datetime(2027, 12, 20) - start).total_seconds() // 3600)
+        for schedule_method, condition in OLD_CONDITIONS.items():
+            rule = rule_for(schedule_method, PARAMS[schedule_method])
+            with self.subTest(schedule_method=schedule_method):
+                for offset in range(hours):
+                    now = start + datetime.timedelta(hours=offset)
+                    self.assertEqual(rule.fires_within(now), condition(now, **PARAMS[schedule_method]), now)
+
+
+class CronRuleTest(unittest.TestCase):
+    def test_fields(self):
+        rule = CronRule("*/15 9-17 * jan,jul mon-fri")
+        self.assertEqual(rule.minutes, [0, 15, 30, 45])
+        self.assertEqual(rule.hours, list(range(9, 18)))
+        self.assertEqual(rule.months, {1, 7})
+        # Stored as Python weekdays, Monday = 0
+        self.assertEqual(rule.weekdays, {0, 1, 2, 3, 4})
+
+    def test_sunday_is_zero_or_seven(self):
+        self.assertEqual(CronRule("0 0 * * 0").weekdays, {6})
+        self.assertEqual(CronRule("0 0 * * 7").weekdays, {6})
+
+    def test_aliases(self):
+        after = datetime.datetime(2024, 5, 17, 10, 30)
+        self.assertEqual(CronRule("@hourly").next_after(after), datetime.datetime(2024, 5, 17, 11, 0))
+        self.assertEqual(CronRule("@daily").next_after(after), datetime.datetime(2024, 5, 18, 0, 0))
+        self.assertEqual(CronRule("@monthly").next_after(after), datetime.datetime(2024, 6, 1, 0, 0))
+        self.assertEqual(CronRule("@yearly").next_after(after), datetime.datetime(2025, 1, 1, 0, 0))
+
+    def test_step_from_a_start_value(self):
+        self.assertEqual(CronRule("5/20 * * * *").minutes, [5, 25, 45])
+
+    def test_day_and_weekday_are_either_or(self):
+        # Cron fires when either the day of month or the weekday matches
+        rule = CronRule("0 0 13 * fri")
+        days = rule.days(2024, 9)
+        self.assertIn(13, days)
+        self.assertIn(6, days)
+        self.assertIn(20, days)
+        self.assertNotIn(14, days)
+
+    def test_day_and_weekday_both(self):
+        # Friday the 13th only
+        rule = CronRule("0 0 13 * fri", day_and_weekday=True)
+        self.assertEqual(rule.next_after(datetime.datetime(2024, 1, 1)), datetime.datetime(2024, 9, 13))
+
+    def test_week_parity(self):
+        rule = CronRule("0 8 * * mon", week_parity="even")
+        fires = rule.next_n(4, datetime.datetime(2024, 1, 1))
+        self.assertTrue(all(fire.isocalendar()[1] % 2 == 0 for fire in fires))
+        self.assertEqual([(b - a).days for a, b in zip(fires, fires[1:])], [14, 14, 14])
+
+    def test_invalid_expressions(self):
+        for expression in ("* * * *", "60 * * * *", "* 24 * * *", "* * 0 * *", "* * * 13 *",
+                           "*/0 * * * *", "5-1 * * * *", "* * * foo *"):
+            with self.subTest(expression=expression):
+                with self.assertRaises(ValueError):
+                    CronRule(expression)
+
+    def test_never_fires(self):
+        self.assertIsNone(CronRule("0 0 30 2 *").next_after(datetime.datetime(2024, 1, 1)))
+        self.assertIsNone(CronRule("0 0 31 4 *").last_at_or_before(datetime.datetime(2024, 1, 1)))
+
+    def test_leap_day(self):
+        rule = CronRule("0 12 29 2 *")
+        self.assertEqual(rule.next_after(datetime.datetime(2024, 3, 1)), datetime.datetime(2028, 2, 29, 12))
+        self.assertEqual(rule.last_at_or_before(datetime.datetime(2027, 1, 1)), datetime.datetime(2024, 2, 29, 12))
+
+
+class NextAfterTest(unittest.TestCase):
+    EXPRESSIONS = ["*/7 3,15 1-10 * 1-5", "0 8 * * *", "30 6 * * sun", "0 0 1,15 * *",
+                   "45 23 31 * *", "0 */6 * feb-apr *", "59 23 * 12 sat"]
+    STARTS = [datetime.datetime(2024, 1, 1), datetime.datetime(2024, 2, 28, 23, 59, 30),
+              datetime.datetime(2024, 12, 31, 23, 45), datetime.datetime(2025, 6, 15, 6, 30)]
+
+    def test_matches_brute_force(self):
+        for expression in self.EXPRESSIONS:
+            rule = CronRule(expression)
+            for start in self.STARTS:
+                with self.subTest(expression=expression, start=start):
+                    self.assertEqual(rule.next_after(start), brute_force_next(rule, start))
+
+    def test_strictly_after(self):
+        rule = CronRule("0 8 * * *")
+        self.assertEqual(rule.next_after(datetime.datetime(2024, 5, 1, 8, 0)), datetime.datetime(2024, 5, 2, 8, 0))
+        self.assertEqual(rule.next_after(datetime.datetime(2024, 5, 1, 7, 59, 59)),
+                         datetime.datetime(2024, 5, 1, 8, 0))
+
+    def test_last_at_or_before_mirrors_next_after(self):
+        for expression in self.EXPRESSIONS:
+            rule = CronRule(expression)
+            for start in self.STARTS:
+                with self.subTest(expression=expression, start=start):
+                    last = rule.last_at_or_before(start)
+                    self.assertLessEqual(last, start)
+                    self.assertGreater(rule.next_after(last), start.replace(second=0, microsecond=0))
+
+    def test_last_at_or_before_includes_when(self):
+        rule = CronRule("0 8 * * *")
+        self.assertEqual(rule.last_at_or_before(datetime.datetime(2024, 5, 1, 8, 0, 30)),
+                         datetime.datetime(2024, 5, 1, 8, 0))
+
+    def test_next_n_and_fires_between(self):
+        rule = CronRule("0 9 * * mon-fri")
+        fires = rule.next_n(5, datetime.datetime(2024, 5, 3, 12))
+        self.assertEqual([fire.day for fire in fires], [6, 7, 8, 9, 10])
+        between = rule.fires_between(datetime.datetime(2024, 5, 6, 9), datetime.datetime(2024, 5, 10, 9))
+        self.assertEqual([fire.day for fire in between], [6, 7, 8, 9])
+
+    def test_fires_within(self):
+        rule = CronRule("30 8 * * *")
+        self.assertTrue(rule.fires_within(datetime.datetime(2024, 5, 1, 8, 5)))
+        self.assertTrue(rule.fires_within(datetime.datetime(2024, 5, 1, 8, 59)))
+        self.assertFalse(rule.fires_within(datetime.datetime(2024, 5, 1, 9, 0)))
+        self.assertTrue(rule.fires_within(datetime.datetime(2024, 5, 1, 3), window=datetime.timedelta(days=1)))
+
+
+class BusinessDayRuleTest(unittest.TestCase):
+    def test_skips_weekends_and_holidays(self):
+        calendar = BusinessCalendar(holidays=["2024-01-01", datetime.date(2024, 1, 2)])
+        rule = BusinessDayRule(1, 7, business_calendar=calendar)
+        # 1 Jan is a holiday, 2 Jan too, so the 3rd; 1 June 2024 is a Saturday
+        self.assertEqual(rule.next_after(datetime.datetime(2023, 12, 31)), datetime.datetime(2024, 1, 3, 7))
+        self.assertEqual(rule.next_after(datetime.datetime(2024, 5, 31)), datetime.datetime(2024, 6, 3, 7))
+
+    def test_second_and_last_business_day(self):
+        self.assertEqual(BusinessDayRule(2, 9).next_after(datetime.datetime(2024, 6, 1)),
+                         datetime.datetime(2024, 6, 4, 9))
+        # 30 June 2024 is a Sunday
+        self.assertEqual(BusinessDayRule(-1, 9).next_after(datetime.datetime(2024, 6, 1)),
+                         datetime.datetime(2024, 6, 28, 9))
+
+    def test_schedule_methods_use_the_calendar(self):
+        calendar = BusinessCalendar(holidays=["2024-07-01"])
+        rule = rule_for("schedule_first_business_day", {"hour": 6}, calendar)
+        self.assertFalse(rule.fires_within(datetime.datetime(2024, 7, 1, 6)))
+        self.assertTrue(rule.fires_within(datetime.datetime(2024, 7, 2, 6)))
+        self.assertTrue(rule_for("schedule_second_business_day", {"hour": 6}, calendar).fires_within(
+            datetime.datetime(2024, 7, 3, 6)))
+
+    def test_n_must_not_be_zero(self):
+        with self.assertRaises(ValueError):
+            BusinessDayRule(0, 9)
+
+
+class RuleForTest(unittest.TestCase):
+    def test_rules_are_compiled_once(self):
+        self.assertIs(rule_for("schedule_daily", {"hour": 8}), rule_for("schedule_daily", {"hour": 8}))
+        self.assertIs(rule_for("schedule_biweekly_odd", {"hour": 8, "days": [1, 2]}),
+                      rule_for("schedule_biweekly_odd", {"days": [1, 2], "hour": 8}))
+
+    def test_unknown_schedule_method(self):
+        with self.assertRaises(ValueError):
+            rule_for("schedule_hourly", {"hour": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+import datetime
+import decimal
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from Framework.AutoApi import SqlTemplate, SqlTemplateCache
+
+
+class TokenizerTest(unittest.TestCase):
+    def test_placeholders_become_question_marks(self):
+        template = SqlTemplate("select * from t where a = :a and b = :b_2")
+        self.assertEqual(template.sql, "select * from t where a = ? and b = ?")
+        self.assertEqual(template.names, ["a", "b_2"])
+
+    def test_repeated_placeholder_is_bound_each_time(self):
+        template = SqlTemplate("select :x, :x")
+        self.assertEqual(template.sql, "select ?, ?")
+        self.assertEqual(template.bind({"x": 1}), (1, 1))
+
+    def test_id_does_not_match_id2(self):
+        template = SqlTemplate("where id = :id or id2 = :id2")
+        self.assertEqual(template.names, ["id", "id2"])
+        self.assertEqual(template.render({"id": 1, "id2": 22}), "where id = 1 or id2 = 22")
+
+    def test_string_literals_are_skipped(self):
+        template = SqlTemplate("select ':not_a_param', 'it''s :still_text' where x = :x")
+        self.assertEqual(template.names, ["x"])
+        self.assertEqual(template.sql, "select ':not_a_param', 'it''s :still_text' where x = ?")
+
+    def test_quoted_and_bracketed_identifiers_are_skipped(self):
+        template = SqlTemplate('select [col:a], [odd]]:b], "c:d" from t where e = :e')
+        self.assertEqual(template.names, ["e"])
+
+    def test_comments_are_skipped(self):
+        template = SqlTemplate("select 1 -- :line\n/* :block\n :more */ where a = :a")
+        self.assertEqual(template.names, ["a"])
+        self.assertEqual(template.sql, "select 1 -- :line\n/* :block\n :more */ where a = ?")
+
+    def test_double_colon_is_not_a_placeholder(self):
+        template = SqlTemplate("select geography::Point(:lat, :lon, 4326)")
+        self.assertEqual(template.names, ["lat", "lon"])
+        self.assertEqual(template.sql, "select geography::Point(?, ?, 4326)")
+
+    def test_colon_after_word_or_variable_is_not_a_placeholder(self):
+        # e.g. times in literals without quotes around them, or @var:name
+        template = SqlTemplate("select 12:30, @v:name, :real")
+        self.assertEqual(template.names, ["real"])
+
+    def test_text_without_placeholders(self):
+        template = SqlTemplate("select 1")
+        self.assertEqual(template.sql, "select 1")
+        self.assertEqual(template.bind({}), ())
+
+
+class BindTest(unittest.TestCase):
+    def test_missing_parameters(self):
+        with self.assertRaises(KeyError):
+            SqlTemplate("where a = :a and b = :b").bind({"a": 1})
+
+    def test_values_become_driver_types(self):
+        template = SqlTemplate(":a :b :c :d :e :f :g")
+        values = template.bind({"a": np.int64(3), "b": np.float64("nan"), "c": pd.Timestamp("2024-05-01 08:00"),
+                                "d": pd.NaT, "e": np.datetime64("2024-05-01T08:00"), "f": None,
+                                "g": decimal.Decimal("1.5")})
+        self.assertEqual(values, (3, None, datetime.datetime(2024, 5, 1, 8), None,
+                                  datetime.datetime(2024, 5, 1, 8), None, decimal.Decimal("1.5")))
+        self.assertIs(type(values[0]), int)
+        self.assertIs(type(values[2]), datetime.datetime)
+
+    def test_nullable_dtype_missing_values_become_null(self):
+        frame = pd.DataFrame({"a": pd.array([1, None], dtype="Int64"), "b": pd.array([None, "x"], dtype="string"),
+                              "c": pd.array([True, None], dtype="boolean")})
+        template = SqlTemplate(":a :b :c")
+        self.assertEqual([template.bind(row) for row in frame.to_dict("records")],
+                         [(1, None, True), (None, "x", None)])
+        self.assertEqual(template.bind({"a": pd.NA, "b": pd.NA, "c": float("nan")}), (None, None, None))
+
+    def test_unsupported_types(self):
+        with self.assertRaises(TypeError):
+            SqlTemplate(":a").bind({"a": object()})
+
+
+class RenderTest(unittest.TestCase):
+    def test_values_are_quoted(self):
+        template = SqlTemplate("insert into t values (:s, :n, :b, :d, :none, :raw)")
+        rendered = template.render({"s": "O'Brien", "n": 1.5, "b": True, "d": datetime.date(2024, 5, 1),
+                                    "none": None, "raw": b"\x00\x10"})
+        self.assertEqual(rendered, "insert into t values (N'O''Brien', 1.5, 1, '2024-05-01', NULL, 0x0010)")
+
+    def test_placeholders_without_a_value_are_left(self):
+        self.assertEqual(SqlTemplate("where a = :a and b = :b").render({"a": 1}), "where a = 1 and b = :b")
+
+
+class SqlTemplateCacheTest(unittest.TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix=".sql")
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+
+    def write(self, text, mtime_ns):
+        with open(self.path, "w") as f:
+            f.write(text)
+        os.utime(self.path, ns=(mtime_ns, mtime_ns))
+
+    def test_compiled_once_and_reloaded_on_change(self):
+        cache = SqlTemplateCache()
+        self.write("select :a", 1_000_000_000)
+        first = cache.get(self.path)
+        self.assertIs(cache.get(self.path), first)
+        self.write("select :a, :b", 2_000_000_000)
+        second = cache.get(self.path)
+        self.assertEqual(second.names, ["a", "b"])
+        stats = cache.stats()
+        self.assertEqual((stats["misses"], stats["hits"], stats["reloads"]), (1, 1, 1))
+
+    def test_invalidate(self):
+        cache = SqlTemplateCache()
+        self.write("select 1", 1_000_000_000)
+        first = cache.get(self.path)
+        cache.invalidate(self.path)
+        self.assertIsNot(cache.get(self.path), first)
+
+
+if __name__ == "__main__":
+    unittest.main()